@@ -0,0 +1,98 @@
+"""
+End-to-end playback benchmark without hardware.
+
+Plays local clips through the same frame iterators and Matrix writer the app
+uses, against a null/framebuffer backend, and reports frame rate, frame-time
+percentiles, pacing error, per-stage CPU time and peak RSS.
+
+    python benchmark.py temp/*.mp4 temp/*.frames.npy [--backend null] [--max-seconds 30] [--json out.json]
+"""
+import argparse
+import json
+import resource
+import sys
+import time
+
+import numpy as np
+
+from matrix_driver import Matrix, make_backend
+from playback import FrameStats, iter_prerendered_frames, is_prerendered
+from yt_processing import iter_video_frames
+
+def _percentiles(values, points=(50, 90, 99)):
+    if not values:
+        return {f"p{p}": None for p in points}
+    arr = np.asarray(values, dtype=np.float64)
+    return {f"p{p}": round(float(np.percentile(arr, p)), 3) for p in points}
+
+def benchmark_clip(matrix, clip, max_seconds=30):
+    stats = FrameStats()
+    if is_prerendered(clip):
+        frames = iter_prerendered_frames(clip, max_seconds=max_seconds, stats=stats)
+    else:
+        frames = iter_video_frames(clip, resolution=(96, 48), max_seconds=max_seconds, stats=stats)
+
+    frame_times = []
+    frame_count = 0
+    started = time.perf_counter()
+    last = started
+    for frame in frames:
+        t0 = time.thread_time()
+        matrix.set_pixels(frame)
+        stats.add("write", time.thread_time() - t0)
+        now = time.perf_counter()
+        frame_times.append((now - last) * 1000.0)
+        last = now
+        frame_count += 1
+    matrix.writer.flush()
+    elapsed = time.perf_counter() - started
+
+    # The first interval includes opening the file; leave it out of the percentiles.
+    return {
+        "clip": clip,
+        "frames": frame_count,
+        "seconds": round(elapsed, 3),
+        "fps": round(frame_count / elapsed, 2) if elapsed > 0 else None,
+        "dropped_frames": stats.dropped_frames,
+        "late_frames": stats.late_frames,
+        "frame_time_ms": _percentiles(frame_times[1:]),
+        "pacing_error_ms": _percentiles([abs(e) for e in stats.pacing_error_ms]),
+        "stage_cpu_ms": {stage: round(seconds * 1000.0, 1) for stage, seconds in sorted(stats.stage_cpu.items())},
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("clips", nargs="+", help="local video files or pre-rendered .frames.npy clips")
+    parser.add_argument("--backend", default="null", help="matrix backend (null, framebuffer, window, spi)")
+    parser.add_argument("--max-seconds", type=float, default=30)
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args(argv)
+
+    matrix = Matrix((96, 48), backend=make_backend(args.backend))
+    results = [benchmark_clip(matrix, clip, max_seconds=args.max_seconds) for clip in args.clips]
+
+    # ru_maxrss is KiB on Linux.
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+    report = {
+        "backend": args.backend,
+        "clips": results,
+        "frames_written": matrix.writer.frames_written,
+        "frames_replaced": matrix.writer.frames_replaced,
+        "peak_rss_mb": round(peak_rss_mb, 1),
+    }
+
+    for r in results:
+        print(f"{r['clip']}: {r['frames']} frames in {r['seconds']}s ({r['fps']} fps, {r['dropped_frames']} dropped, {r['late_frames']} late)")
+        print(f"  frame time ms: {r['frame_time_ms']}")
+        print(f"  pacing error ms: {r['pacing_error_ms']}")
+        print(f"  stage cpu ms: {r['stage_cpu_ms']}")
+    print(f"Frames written: {report['frames_written']} (replaced before send: {report['frames_replaced']})")
+    print(f"Peak RSS: {report['peak_rss_mb']} MB")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    return report
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,96 @@
+import heapq
+import itertools
+import threading
+import time
+
+class CandidateReservoir:
+    """
+    Bounded priority pool of prefiltered search entries carried over between searches.
+
+    Best candidates come out first: entries the prefilter already passed before
+    ambiguous ones, then fresher uploads, then fewer views. An entry expires when
+    its upload would fall outside `max_age_days`, or after `ttl_seconds` in the
+    pool if its upload date is unknown (results go stale as views accumulate).
+    When the pool holds more than `capacity` entries the worst are dropped.
+    """
+    def __init__(self, capacity=200, low_water=10, max_age_days=7, ttl_seconds=6 * 3600):
+        self.capacity = capacity
+        self.low_water = low_water
+        self.max_age_days = max_age_days
+        self.ttl_seconds = ttl_seconds
+
+        self._heap = []
+        self._ids = set()
+        self._counter = itertools.count()
+        self._cond = threading.Condition()
+        self.added = 0
+        self.expired = 0
+        self.dropped = 0
+
+    def __len__(self):
+        return len(self._heap)
+
+    def is_low(self):
+        return len(self._heap) < self.low_water
+
+    def add(self, entry, record, confident):
+        """Add a search entry with its normalized prefilter record. Returns False if it was already pooled."""
+        vid = record.get("id")
+        now = time.time()
+        age_days = record.get("age_days")
+        if age_days is not None:
+            # age_days is whole days, and an upload stays recent enough while it is <= max_age_days.
+            expires_at = now + max(0, self.max_age_days + 1 - age_days) * 86400
+        else:
+            expires_at = now + self.ttl_seconds
+        expires_at = min(expires_at, now + self.ttl_seconds)
+
+        priority = (
+            0 if confident else 1,
+            age_days if age_days is not None else self.max_age_days,
+            record.get("view_count") if record.get("view_count") is not None else float("inf"),
+        )
+        with self._cond:
+            if vid in self._ids:
+                return False
+            self._ids.add(vid)
+            heapq.heappush(self._heap, (priority, next(self._counter), expires_at, confident, entry))
+            self.added += 1
+            if len(self._heap) > self.capacity:
+                kept = heapq.nsmallest(self.capacity, self._heap)
+                kept_counters = {item[1] for item in kept}
+                for item in self._heap:
+                    if item[1] not in kept_counters:
+                        self._ids.discard(item[4].get("id"))
+                self.dropped += len(self._heap) - len(kept)
+                self._heap = kept
+                heapq.heapify(self._heap)
+            self._cond.notify_all()
+        return True
+
+    def pop(self, skip=None):
+        """
+        Take the best unexpired entry, as (entry, confident), or None if the pool is empty.
+
+        `skip(entry)` lets the caller discard entries (e.g. IDs seen since they were pooled).
+        """
+        now = time.time()
+        with self._cond:
+            try:
+                while self._heap:
+                    _, _, expires_at, confident, entry = heapq.heappop(self._heap)
+                    self._ids.discard(entry.get("id"))
+                    if expires_at < now:
+                        self.expired += 1
+                        continue
+                    if skip is not None and skip(entry):
+                        continue
+                    return entry, confident
+                return None
+            finally:
+                self._cond.notify_all()
+
+    def wait_until_low(self, timeout=None):
+        """Block until the pool is below its low-water mark."""
+        with self._cond:
+            return self._cond.wait_for(self.is_low, timeout=timeout)
@@ -0,0 +1,308 @@
+import collections
+import os
+import shutil
+import sqlite3
+import threading
+import time
+
+from playback import is_prerendered
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+# Downloads and pre-rendered clips. CLIP_STORE_TMPFS=1 keeps them in RAM so the
+# download -> pre-render -> play path never writes to the SD card; YT_TEMP_DIR
+# picks any other location.
+TMPFS_TEMP_DIR = "/dev/shm/yt-no-views-matrix"
+if os.getenv("YT_TEMP_DIR", "").strip():
+    TEMP_DIR = os.path.abspath(os.getenv("YT_TEMP_DIR").strip())
+elif os.getenv("CLIP_STORE_TMPFS", "").strip() in ("1", "true", "True", "yes", "YES") and os.path.isdir("/dev/shm"):
+    TEMP_DIR = TMPFS_TEMP_DIR
+else:
+    TEMP_DIR = os.path.join(BASE_DIR, "temp")
+CLIP_STORE_PATH = os.getenv("CLIP_STORE_DB", os.path.join(BASE_DIR, "clip_store.sqlite3"))
+# Already played clips kept across restarts (see WarmClips). Unlike TEMP_DIR
+# this must survive a reboot, so it is never on tmpfs.
+WARM_CLIP_DIR = os.getenv("WARM_CLIP_DIR", os.path.join(BASE_DIR, "warm_clips"))
+
+# Lifecycle of a clip file in the temp dir. A clip that is done has its files
+# deleted and its row removed.
+DOWNLOADING = "downloading"
+READY = "ready"
+PLAYING = "playing"
+
+def _file_size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+def _vid(path):
+    # Files are named `<id>.<ext>` (plus .part/.frames.npy/... suffixes).
+    return os.path.basename(path).split(".", 1)[0]
+
+def _remove(path):
+    try:
+        os.remove(path)
+        return True
+    except FileNotFoundError:
+        return False
+    except OSError as e:
+        print(f"Failed to remove {path}: {type(e).__name__}: {e}")
+        return False
+
+class ClipStore:
+    """
+    Tracks every file the finder puts in the temp dir through downloading -> ready -> playing -> done.
+
+    States live in SQLite (kept off the temp dir, which may be tmpfs), so after
+    a crash `recover()` can tell finished clips from leftovers: ready
+    pre-rendered clips are handed back for playback and everything else
+    (partial downloads, half-written clips, files we never tracked) is deleted.
+    `enforce_quota()` makes room for a new clip when the directory grows past
+    its byte quota or the filesystem runs low on space.
+
+    The finder and the player each open their own instance on the same database.
+    """
+    def __init__(self, directory, path=CLIP_STORE_PATH, min_free_bytes=64 * 1024 * 1024):
+        self.directory = directory
+        self.path = path
+        self.min_free_bytes = min_free_bytes
+
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        db_directory = os.path.dirname(self.path)
+        if db_directory:
+            os.makedirs(db_directory, exist_ok=True)
+        self._db = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS clips ("
+            " vid TEXT PRIMARY KEY,"
+            " path TEXT NOT NULL,"
+            " state TEXT NOT NULL,"
+            " bytes INTEGER NOT NULL DEFAULT 0,"
+            " updated REAL NOT NULL)"
+        )
+        self._db.commit()
+
+    def _set(self, vid, path, state):
+        if not vid:
+            return
+        with self._lock:
+            try:
+                with self._db:
+                    self._db.execute(
+                        "INSERT INTO clips (vid, path, state, bytes, updated) VALUES (?, ?, ?, ?, ?)"
+                        " ON CONFLICT(vid) DO UPDATE SET path = excluded.path, state = excluded.state,"
+                        " bytes = excluded.bytes, updated = excluded.updated",
+                        (vid, path, state, _file_size(path), time.time()),
+                    )
+            except Exception as e:
+                print(f"Failed to record clip {vid} as {state}: {type(e).__name__}: {e}")
+
+    def downloading(self, vid, path):
+        self._set(vid, path, DOWNLOADING)
+
+    def ready(self, vid, path):
+        self._set(vid, path, READY)
+
+    def playing(self, vid, path):
+        self._set(vid, path, PLAYING)
+
+    def count(self, state=None):
+        """Number of tracked clips, optionally only those in `state`."""
+        return len(self._rows(state))
+
+    def done(self, vid, *paths):
+        """Delete a clip's files (its recorded path plus any extra `paths`) and forget it."""
+        with self._lock:
+            row = self._db.execute("SELECT path FROM clips WHERE vid = ?", (vid,)).fetchone()
+        for path in set(paths) | ({row[0]} if row else set()):
+            _remove(path)
+        with self._lock:
+            try:
+                with self._db:
+                    self._db.execute("DELETE FROM clips WHERE vid = ?", (vid,))
+            except Exception as e:
+                print(f"Failed to forget clip {vid}: {type(e).__name__}: {e}")
+
+    def _rows(self, state=None):
+        query = "SELECT vid, path, state, bytes, updated FROM clips"
+        args = ()
+        if state is not None:
+            query += " WHERE state = ?"
+            args = (state,)
+        with self._lock:
+            return self._db.execute(query + " ORDER BY updated", args).fetchall()
+
+    def recover(self, is_playable):
+        """
+        Reconcile the temp dir with the database after a (re)start.
+
+        Returns the paths of ready clips, oldest first, for which
+        `is_playable(path)` holds; every other file in the directory and every
+        other row is removed. Call this once, before any downloads start.
+        """
+        keep = []
+        for vid, path, state, _, _ in self._rows():
+            if state == READY and os.path.exists(path) and is_playable(path):
+                keep.append((vid, path))
+            else:
+                self.done(vid)
+
+        kept_paths = {os.path.abspath(path) for _, path in keep}
+        purged = 0
+        purged_bytes = 0
+        try:
+            with os.scandir(self.directory) as it:
+                for entry in it:
+                    if not entry.is_file() or os.path.abspath(entry.path) in kept_paths:
+                        continue
+                    size = _file_size(entry.path)
+                    if _remove(entry.path):
+                        purged += 1
+                        purged_bytes += size
+        except FileNotFoundError:
+            pass
+        print(f"Clip store: recovered {len(keep)} ready clips, purged {purged} orphaned files ({purged_bytes} bytes) from {self.directory}")
+        return [path for _, path in keep]
+
+    def used_bytes(self):
+        total = 0
+        try:
+            with os.scandir(self.directory) as it:
+                for entry in it:
+                    try:
+                        if entry.is_file():
+                            total += entry.stat().st_size
+                    except OSError:
+                        pass
+        except FileNotFoundError:
+            pass
+        return total
+
+    def low_on_space(self):
+        """True if the filesystem holding the directory has less than `min_free_bytes` free."""
+        try:
+            return shutil.disk_usage(self.directory).free < self.min_free_bytes
+        except OSError:
+            return False
+
+    def _over_quota(self, quota_bytes):
+        return self.used_bytes() > quota_bytes or self.low_on_space()
+
+    def enforce_quota(self, quota_bytes, vid):
+        """
+        Make room for clip `vid`, finished but not yet readied, under `quota_bytes` with `min_free_bytes` free.
+
+        Files we don't track are evicted first. Ready clips never are: each
+        one is already in the player's queue. Returns True if `vid` may be
+        readied; if not, the caller drops it (see `done`).
+        """
+        if not self._over_quota(quota_bytes):
+            return True
+        tracked = {tracked_vid for tracked_vid, _, _, _, _ in self._rows()}
+        # Anything we can't account for, e.g. a finished download whose row is gone.
+        # Partial and temporary files of a tracked clip share its ID and are kept.
+        try:
+            with os.scandir(self.directory) as it:
+                untracked = [entry.path for entry in it if entry.is_file() and _vid(entry.path) not in tracked]
+        except FileNotFoundError:
+            untracked = []
+        for path in untracked:
+            if not self._over_quota(quota_bytes):
+                return True
+            _remove(path)
+        if not self._over_quota(quota_bytes):
+            return True
+        return False
+
+    def close(self):
+        try:
+            with self._lock:
+                self._db.close()
+        except Exception:
+            pass
+
+class WarmClips:
+    """
+    A few pre-rendered clips kept across restarts so the player has something to show the moment it starts.
+
+    After a clip has played, `keep()` moves it here instead of it being
+    deleted, replacing the oldest once `max_clips` are kept. To spare the SD
+    card when the temp dir is on tmpfs (each keep is then a ~10 MB copy), a
+    full set is only refreshed once its newest clip is `refresh_seconds` old.
+    These clips were already shown, so the player only falls back to them while
+    it has nothing new to play. Only the player process uses this.
+    """
+    def __init__(self, directory=WARM_CLIP_DIR, max_clips=3, refresh_seconds=3600):
+        self.directory = directory
+        self.max_clips = max_clips
+        self.refresh_seconds = refresh_seconds
+        self._shown = collections.Counter()
+        if max_clips > 0:
+            os.makedirs(directory, exist_ok=True)
+        # Leftovers of a keep() interrupted by a crash.
+        try:
+            with os.scandir(directory) as it:
+                stale = [entry.path for entry in it if entry.is_file() and not is_prerendered(entry.path)]
+        except FileNotFoundError:
+            stale = []
+        for path in stale:
+            _remove(path)
+
+    def clips(self):
+        """Kept clips, oldest first."""
+        try:
+            with os.scandir(self.directory) as it:
+                entries = [(entry.stat().st_mtime, entry.path) for entry in it if entry.is_file() and is_prerendered(entry.path)]
+        except FileNotFoundError:
+            return []
+        return [path for _, path in sorted(entries)]
+
+    def next(self):
+        """The kept clip shown least often so far, or None if there are none."""
+        clips = self.clips()
+        if not clips:
+            return None
+        # min() keeps the first of equal counts, i.e. the oldest clip.
+        path = min(clips, key=lambda p: self._shown[p])
+        self._shown[path] += 1
+        return path
+
+    def keep(self, clip_file):
+        """Move a played pre-rendered clip into the warm set. True if it was kept."""
+        if self.max_clips <= 0 or not is_prerendered(clip_file) or not os.path.exists(clip_file):
+            return False
+        clips = self.clips()
+        if len(clips) >= self.max_clips:
+            try:
+                newest_age = time.time() - os.path.getmtime(clips[-1])
+            except OSError:
+                newest_age = self.refresh_seconds
+            if newest_age < self.refresh_seconds:
+                return False
+
+        dest = os.path.join(self.directory, os.path.basename(clip_file))
+        tmp = dest + ".tmp"
+        try:
+            # A rename if both are on the same filesystem, a copy otherwise;
+            # either way the clip only appears under its final name once complete.
+            shutil.move(clip_file, tmp)
+            os.replace(tmp, dest)
+            # Mark it as just kept (a rename preserves the original mtime).
+            os.utime(dest)
+        except OSError as e:
+            print(f"Failed to keep warm clip {clip_file}: {type(e).__name__}: {e}")
+            _remove(tmp)
+            return False
+
+        clips = [path for path in self.clips() if path != dest] + [dest]
+        for path in clips[:-self.max_clips]:
+            self.discard(path)
+        print(f"Kept warm clip {dest} ({min(len(clips), self.max_clips)}/{self.max_clips})")
+        return True
+
+    def discard(self, path):
+        self._shown.pop(path, None)
+        _remove(path)
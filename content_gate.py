@@ -0,0 +1,192 @@
+import collections
+import json
+import os
+import shutil
+import subprocess
+import threading
+
+import cv2
+import numpy as np
+
+import metrics
+from frame_preprocess import FramePreprocessor, ffmpeg_crop_scale
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CONTENT_GATE_CACHE = os.getenv("CONTENT_GATE_CACHE", os.path.join(BASE_DIR, "content_gate.json"))
+
+# Thresholds on 0-255 luma. A clip is rejected if its sampled frames are on
+# average darker than MIN_BRIGHTNESS, if the typical frame has less spatial
+# detail (luma standard deviation) than MIN_DETAIL, or if consecutive samples
+# differ by less than MIN_MOTION on average. 0 disables a check.
+MIN_BRIGHTNESS = float(os.getenv("CONTENT_GATE_MIN_BRIGHTNESS", "12"))
+MIN_DETAIL = float(os.getenv("CONTENT_GATE_MIN_DETAIL", "6"))
+MIN_MOTION = float(os.getenv("CONTENT_GATE_MIN_MOTION", "1"))
+MIN_SAMPLES = 3
+
+_LUMA = np.array([0.299, 0.587, 0.114], dtype=np.float32)
+
+def _ffmpeg_keyframes(video_file, resolution, max_seconds, limit):
+    # -skip_frame nokey: only keyframes are decoded at all.
+    width, height = resolution
+    cmd = [
+        "ffmpeg", "-hide_banner", "-nostdin", "-loglevel", "error",
+        "-skip_frame", "nokey",
+        "-t", str(max_seconds),
+        "-i", video_file,
+        "-an", "-vf", ffmpeg_crop_scale(resolution),
+        "-vsync", "passthrough", "-frames:v", str(limit),
+        "-pix_fmt", "rgb24", "-f", "rawvideo", "pipe:1",
+    ]
+    out = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, timeout=60).stdout
+    count = len(out) // (width * height * 3)
+    return np.frombuffer(out, dtype=np.uint8, count=count * width * height * 3).reshape(count, height, width, 3)
+
+def _opencv_samples(video_file, resolution, max_seconds, count):
+    # Seek to `count` evenly spaced points; each seek decodes at most one GOP.
+    width, height = resolution
+    cap = cv2.VideoCapture(video_file)
+    if not cap.isOpened():
+        cap.release()
+        return np.empty((0, height, width, 3), dtype=np.uint8)
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    frame_count = cap.get(cv2.CAP_PROP_FRAME_COUNT)
+    duration = min(frame_count / fps if frame_count > 0 else max_seconds, max_seconds)
+    preprocessor = FramePreprocessor(resolution, lut=None)
+    frames = []
+    try:
+        for i in range(count):
+            cap.set(cv2.CAP_PROP_POS_MSEC, (i + 0.5) * duration / count * 1000.0)
+            ok, frame = cap.read()
+            if ok:
+                frames.append(preprocessor.process(frame).copy())
+    finally:
+        cap.release()
+    if not frames:
+        return np.empty((0, height, width, 3), dtype=np.uint8)
+    return np.stack(frames)
+
+def sample_frames(video_file, resolution=(96, 48), max_seconds=30, count=8):
+    """
+    A few RGB frames of `video_file` at `resolution`, for a fraction of the cost of decoding it.
+
+    Keyframes (up to 4 * `count`) through ffmpeg when available, otherwise
+    `count` frames found by seeking with OpenCV. A clip with only one or two
+    keyframes yields just those: seeking in it would decode most of it again
+    for every sample.
+    """
+    if shutil.which("ffmpeg"):
+        try:
+            frames = _ffmpeg_keyframes(video_file, resolution, max_seconds, limit=4 * count)
+            if len(frames):
+                return frames
+        except (OSError, subprocess.SubprocessError) as e:
+            print(f"Keyframe sampling failed ({type(e).__name__}: {e}), seeking instead")
+    return _opencv_samples(video_file, resolution, max_seconds, count)
+
+def score_frames(frames):
+    """Brightness, detail and motion of sampled RGB frames, all in 0-255 luma units."""
+    if len(frames) == 0:
+        return {"samples": 0, "brightness": 0.0, "detail": 0.0, "motion": 0.0}
+    luma = frames.astype(np.float32) @ _LUMA
+    per_frame_detail = luma.reshape(len(luma), -1).std(axis=1)
+    return {
+        "samples": len(frames),
+        "brightness": float(luma.mean()),
+        # Median, so a couple of black transition frames don't decide it.
+        "detail": float(np.median(per_frame_detail)),
+        "motion": float(np.abs(np.diff(luma, axis=0)).mean()) if len(frames) > 1 else 0.0,
+    }
+
+class ContentGate:
+    """
+    Rejects downloaded clips that would waste a playback slot: black screens, blank frames, static images.
+
+    Runs on the download worker before the clip is pre-rendered, from a handful
+    of sampled frames (see `sample_frames`). Scores, not verdicts, are cached
+    by video ID and persisted, so changed thresholds apply to cached clips too.
+    """
+    def __init__(self, path=CONTENT_GATE_CACHE, min_brightness=MIN_BRIGHTNESS, min_detail=MIN_DETAIL, min_motion=MIN_MOTION,
+                 resolution=(96, 48), samples=8, max_entries=5000, save_every=10):
+        self.path = path
+        self.min_brightness = min_brightness
+        self.min_detail = min_detail
+        self.min_motion = min_motion
+        self.resolution = resolution
+        self.samples = samples
+        self.max_entries = max_entries
+        self.save_every = save_every
+
+        self._lock = threading.Lock()
+        # vid -> scores, least recently added first
+        self._scores = collections.OrderedDict()
+        self._unsaved = 0
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            print(f"Ignoring unreadable content gate cache {self.path}: {type(e).__name__}: {e}")
+            return
+        for vid, scores in data.items():
+            self._scores[vid] = scores
+        print(f"Loaded content scores for {len(self._scores)} videos from {self.path}")
+
+    def save(self):
+        with self._lock:
+            tmp_path = f"{self.path}.tmp"
+            try:
+                with open(tmp_path, "w") as f:
+                    json.dump(self._scores, f)
+                os.replace(tmp_path, self.path)
+                self._unsaved = 0
+            except Exception as e:
+                print(f"Failed to save content gate cache: {type(e).__name__}: {e}")
+
+    def scores(self, vid, video_file):
+        with self._lock:
+            cached = self._scores.get(vid)
+        if cached is not None:
+            metrics.inc("finder_content_gate_cache_hits_total")
+            return cached
+        with metrics.span("finder_content_gate"):
+            scores = score_frames(sample_frames(video_file, resolution=self.resolution, count=self.samples))
+        with self._lock:
+            self._scores[vid] = scores
+            while len(self._scores) > self.max_entries:
+                self._scores.popitem(last=False)
+            self._unsaved += 1
+            should_save = self._unsaved >= self.save_every
+        if should_save:
+            self.save()
+        return scores
+
+    def rejection(self, scores):
+        """Why a clip with these scores should be skipped, or None if it is fine."""
+        if scores["samples"] == 0:
+            return "no frames"
+        # One or two frames (often the opening one) say too little to reject on.
+        if scores["samples"] < MIN_SAMPLES:
+            return None
+        if scores["brightness"] < self.min_brightness:
+            return "too dark"
+        if scores["detail"] < self.min_detail:
+            return "blank"
+        if scores["motion"] < self.min_motion:
+            return "static"
+        return None
+
+    def check(self, vid, video_file):
+        """Score a downloaded clip (or reuse its cached scores); returns the rejection reason or None."""
+        scores = self.scores(vid, video_file)
+        reason = self.rejection(scores)
+        metrics.inc("finder_content_gate_total", verdict=reason or "pass")
+        print(
+            f"Content gate {'rejected' if reason else 'passed'} {vid}"
+            f"{f' ({reason})' if reason else ''}: brightness {scores['brightness']:.1f},"
+            f" detail {scores['detail']:.1f}, motion {scores['motion']:.1f} over {scores['samples']} samples"
+        )
+        return reason
@@ -0,0 +1,296 @@
+"""
+Central discovery: one node runs the finder and hands prepared clips to many display nodes.
+
+Without it every panel runs its own finder, so N panels search N times as much,
+share the same rate limits and can show the same videos. Here a single
+discovery node searches, downloads and pre-renders, and display nodes (App.run
+plus Matrix, nothing else) fetch finished clips from it over HTTP:
+
+    GET  /clip?node=<name>&wait=<seconds>  long-poll for the next clip; 200 with
+                                            the file (X-Clip-Name header) or 204
+    POST /played  {"node": ..., "vid": ...} record a played clip in the shared index
+    GET  /status                            ready clips and per-node counters
+
+Each clip is handed to exactly one node and deleted on the server once sent,
+so no video reaches two panels; the server's SeenIndex is the one shared
+seen/played index, since display nodes report plays to it.
+
+Run the discovery node with `python discovery.py [--port 8765]` and point
+display nodes at it with DISCOVERY_URL=http://<host>:8765 (see main.py).
+"""
+import argparse
+import collections
+import json
+import multiprocessing as mp
+import os
+import queue
+import re
+import shutil
+import socket
+import threading
+import time
+import urllib.parse
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import metrics
+from clip_store import ClipStore, TEMP_DIR, READY
+from playback import is_prerendered, is_streaming, video_id_from_path
+from seen_index import SeenIndex
+
+DISCOVERY_PORT = int(os.getenv("DISCOVERY_PORT", "8765"))
+# Clip names we accept from the server: `<id>.<ext>[.<ext>...]`, no path parts.
+_CLIP_NAME = re.compile(r"^[A-Za-z0-9_-]+(\.[A-Za-z0-9]+)+$")
+
+class ClipDispatcher:
+    """
+    Hands each finished clip from the finder's queue to exactly one display node.
+
+    A clip leaves the ready list when a node asks for it; if sending it fails
+    it goes back to the front, once it has been sent its files are deleted and
+    the finder is told it has space again.
+    """
+    def __init__(self, video_queue, space_freed, clip_store, seen_index, recovered=()):
+        self.video_queue = video_queue
+        self.space_freed = space_freed
+        self.clip_store = clip_store
+        self.seen_index = seen_index
+
+        self._cond = threading.Condition()
+        self._ready = collections.deque(recovered)
+        self.nodes = {}
+
+        threading.Thread(target=self._collect, name="clip-collector", daemon=True).start()
+
+    def _collect(self):
+        while True:
+            clip_file = self.video_queue.get()
+            if is_streaming(clip_file):
+                # Remote nodes need whole files; the finder runs with streaming off.
+                print(f"Ignoring in-progress download: {clip_file}")
+                continue
+            with self._cond:
+                self._ready.append(clip_file)
+                metrics.set_gauge("discovery_ready_clips", len(self._ready))
+                self._cond.notify()
+
+    def _node(self, node):
+        stats = self.nodes.get(node)
+        if stats is None:
+            stats = self.nodes[node] = {"served": 0, "played": 0, "last_seen": 0.0}
+        stats["last_seen"] = time.time()
+        return stats
+
+    def take(self, node, timeout):
+        """Oldest ready clip for `node`, waiting up to `timeout` seconds; None if there is none."""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            self._node(node)
+            while True:
+                while self._ready:
+                    clip_file = self._ready.popleft()
+                    metrics.set_gauge("discovery_ready_clips", len(self._ready))
+                    if os.path.exists(clip_file):
+                        return clip_file
+                    print(f"Ready clip disappeared: {clip_file}")
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._cond.wait(timeout=remaining)
+
+    def give_back(self, clip_file):
+        """Put a clip that couldn't be sent back at the front of the line."""
+        with self._cond:
+            self._ready.appendleft(clip_file)
+            metrics.set_gauge("discovery_ready_clips", len(self._ready))
+            self._cond.notify()
+
+    def sent(self, node, clip_file):
+        with self._cond:
+            self._node(node)["served"] += 1
+        metrics.inc("discovery_clips_served_total", node=node)
+        self.clip_store.done(video_id_from_path(clip_file), clip_file)
+        with self.space_freed:
+            self.space_freed.notify_all()
+
+    def played(self, node, vid):
+        with self._cond:
+            self._node(node)["played"] += 1
+        metrics.inc("discovery_clips_played_total", node=node)
+        self.seen_index.mark_played(vid)
+
+    def status(self):
+        with self._cond:
+            return {"ready": len(self._ready), "nodes": {node: dict(stats) for node, stats in self.nodes.items()}}
+
+class _DiscoveryHandler(BaseHTTPRequestHandler):
+    # Set on the server: self.server.dispatcher
+
+    def _send_json(self, code, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        params = urllib.parse.parse_qs(url.query)
+        dispatcher = self.server.dispatcher
+        if url.path == "/status":
+            self._send_json(200, dispatcher.status())
+            return
+        if url.path != "/clip":
+            self.send_error(404)
+            return
+
+        node = (params.get("node") or [self.client_address[0]])[0]
+        try:
+            wait = min(float((params.get("wait") or ["0"])[0]), 60.0)
+        except ValueError:
+            wait = 0.0
+        clip_file = dispatcher.take(node, wait)
+        if clip_file is None:
+            self.send_response(204)
+            self.end_headers()
+            return
+
+        try:
+            with open(clip_file, "rb") as f:
+                self.send_response(200)
+                self.send_header("Content-Type", "application/octet-stream")
+                self.send_header("Content-Length", str(os.fstat(f.fileno()).st_size))
+                self.send_header("X-Clip-Name", os.path.basename(clip_file))
+                self.end_headers()
+                shutil.copyfileobj(f, self.wfile)
+        except OSError as e:
+            print(f"Failed to send {clip_file} to {node}: {type(e).__name__}: {e}")
+            dispatcher.give_back(clip_file)
+            return
+        print(f"Sent {os.path.basename(clip_file)} to {node}")
+        dispatcher.sent(node, clip_file)
+
+    def do_POST(self):
+        if self.path != "/played":
+            self.send_error(404)
+            return
+        try:
+            length = int(self.headers.get("Content-Length", "0"))
+            report = json.loads(self.rfile.read(length) or b"{}")
+            vid = str(report["vid"])
+        except (ValueError, KeyError, TypeError):
+            self.send_error(400)
+            return
+        self.server.dispatcher.played(str(report.get("node") or self.client_address[0]), vid)
+        self._send_json(200, {"ok": True})
+
+    def log_message(self, format, *args):
+        pass
+
+def serve(host="0.0.0.0", port=DISCOVERY_PORT):
+    """Run the finder here and serve its clips until interrupted."""
+    # Not at the top: display nodes import this module from main.py.
+    from main import video_finder, _metrics_port
+
+    # Clips are only handed out once complete.
+    os.environ["STREAM_PLAYBACK"] = "off"
+    video_queue = mp.Queue()
+    space_freed = mp.Condition()
+    clip_store = ClipStore(TEMP_DIR)
+    recovered = clip_store.recover(is_prerendered)
+
+    print("Starting video finder process")
+    finder = mp.Process(target=video_finder, args=(video_queue, space_freed), daemon=True)
+    finder.start()
+
+    metrics.start_exporter("discovery", port=_metrics_port())
+    server = ThreadingHTTPServer((host, port), _DiscoveryHandler)
+    server.daemon_threads = True
+    server.dispatcher = ClipDispatcher(video_queue, space_freed, clip_store, SeenIndex(), recovered=recovered)
+    print(f"Discovery server listening on http://{host}:{port}")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+# Display node side
+
+def fetch_clips(url, video_queue, space_freed, temp_dir=TEMP_DIR, node=None, prefetch=2, wait_seconds=30):
+    """
+    Keep up to `prefetch` clips from the discovery server on disk and queued for the player.
+
+    Stands in for `video_finder` on a display node: clips go through the same
+    ClipStore states, so the player and crash recovery treat them like local ones.
+    """
+    node = node or socket.gethostname()
+    store = ClipStore(temp_dir)
+    clip_url = url.rstrip("/") + "/clip?" + urllib.parse.urlencode({"node": node, "wait": wait_seconds})
+    print(f"Fetching clips for node {node} from {url}")
+    while True:
+        with space_freed:
+            while store.count(READY) >= prefetch:
+                space_freed.wait(timeout=5)
+
+        vid = None
+        try:
+            with urllib.request.urlopen(clip_url, timeout=wait_seconds + 30) as response:
+                if response.status == 204:
+                    continue
+                name = response.headers.get("X-Clip-Name", "")
+                if not _CLIP_NAME.match(name):
+                    raise ValueError(f"bad clip name {name!r}")
+                clip_file = os.path.join(temp_dir, name)
+                vid = video_id_from_path(clip_file)
+                tmp_file = clip_file + ".download"
+                store.downloading(vid, tmp_file)
+                started = time.perf_counter()
+                with open(tmp_file, "wb") as f:
+                    shutil.copyfileobj(response, f)
+                os.replace(tmp_file, clip_file)
+        except (OSError, ValueError) as e:
+            print(f"Failed to fetch a clip from {url}: {type(e).__name__}: {e}")
+            if vid is not None:
+                store.done(vid, tmp_file)
+            metrics.inc("display_fetch_errors_total")
+            time.sleep(5)
+            continue
+
+        store.ready(vid, clip_file)
+        metrics.inc("display_clips_fetched_total")
+        metrics.observe("display_fetch_seconds", time.perf_counter() - started)
+        print(f"Fetched {name} ({os.path.getsize(clip_file)} bytes)")
+        video_queue.put(clip_file)
+
+class PlayedReporter:
+    """
+    Reports played clips to the discovery server's shared index; used by the player instead of a local SeenIndex.
+
+    Reports are sent from a background thread so playback never waits on the network.
+    """
+    def __init__(self, url, node=None):
+        self.url = url.rstrip("/") + "/played"
+        self.node = node or socket.gethostname()
+        self._pending = queue.Queue()
+        threading.Thread(target=self._run, name="played-reporter", daemon=True).start()
+
+    def mark_played(self, vid):
+        self._pending.put(vid)
+
+    def _run(self):
+        while True:
+            vid = self._pending.get()
+            body = json.dumps({"node": self.node, "vid": vid}).encode()
+            request = urllib.request.Request(self.url, data=body, headers={"Content-Type": "application/json"})
+            try:
+                with urllib.request.urlopen(request, timeout=10):
+                    pass
+            except OSError as e:
+                print(f"Failed to report {vid} as played: {type(e).__name__}: {e}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the finder and serve its clips to display nodes.")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=DISCOVERY_PORT)
+    args = parser.parse_args()
+    serve(args.host, args.port)
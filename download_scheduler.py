@@ -0,0 +1,220 @@
+import os
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+from clip_store import ClipStore, TEMP_DIR
+from playback import STREAM_SUFFIX, prerendered_seconds, video_id_from_path
+from yt_processing import prerender_video, delete_video
+
+class DownloadScheduler:
+    """
+    Keeps up to `max_in_flight` downloads running while staying under a byte budget for TEMP_DIR.
+
+    Instead of polling a bounded queue, the scheduler blocks on `space_freed`
+    (a multiprocessing.Condition) until a download finishes or the player
+    deletes a clip it has played.
+
+    `stream_playback` controls progressive playback: with "auto" a download
+    started while the player has nothing queued is handed over as soon as
+    `stream_start_bytes` of it are on disk, instead of after download and
+    pre-render; "always" does that for every download, "off" never.
+
+    Every file goes through `store` (a ClipStore on `temp_dir`), which also
+    evicts clips if the directory ends up over `byte_budget` anyway.
+
+    If a `content_gate` is given, finished downloads it rejects are deleted
+    instead of being pre-rendered; streamed downloads skip it.
+    """
+    def __init__(self, ydl, video_queue, space_freed, max_in_flight=2, byte_budget=256 * 1024 * 1024,
+                 clip_reserve_bytes=32 * 1024 * 1024, temp_dir=TEMP_DIR, resolution=(96, 48),
+                 stream_playback="auto", stream_start_bytes=256 * 1024, store=None, content_gate=None):
+        self.ydl = ydl
+        self.video_queue = video_queue
+        self.space_freed = space_freed
+        self.max_in_flight = max_in_flight
+        self.byte_budget = byte_budget
+        # Budget held back for each in-flight download until its files land on disk.
+        self.clip_reserve_bytes = clip_reserve_bytes
+        self.temp_dir = temp_dir
+        self.store = store or ClipStore(temp_dir)
+        self.resolution = resolution
+        self.content_gate = content_gate
+        self.stream_playback = stream_playback
+        self.stream_start_bytes = stream_start_bytes
+        if stream_playback != "off" and not shutil.which("ffmpeg"):
+            print("ffmpeg not found, progressive playback disabled")
+            self.stream_playback = "off"
+
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._pool = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="download")
+        self.download_count = 0
+        # Bandwidth/disk cost per second of video we actually show.
+        self.bytes_downloaded = 0
+        self.seconds_prepared = 0.0
+
+    def used_bytes(self):
+        return self.store.used_bytes()
+
+    def _has_capacity(self):
+        with self._lock:
+            in_flight = self._in_flight
+        if in_flight >= self.max_in_flight:
+            return False
+        # Whatever we download now would only be dropped by enforce_quota.
+        if self.store.low_on_space():
+            return False
+        return self.used_bytes() + (in_flight + 1) * self.clip_reserve_bytes <= self.byte_budget
+
+    def acquire_slot(self):
+        """Block until a download may start, then reserve its slot. Pair with `process` or `release_slot`."""
+        with self.space_freed:
+            announced = False
+            while not self._has_capacity():
+                if not announced:
+                    print(f"Download slots/budget full ({self._in_flight} in flight, {self.used_bytes()} bytes in {self.temp_dir}), waiting...")
+                    announced = True
+                # The timeout is only a safety net in case a notify is missed
+                # (e.g. files removed by hand).
+                self.space_freed.wait(timeout=30)
+            with self._lock:
+                self._in_flight += 1
+
+    def _notify(self):
+        with self.space_freed:
+            self.space_freed.notify_all()
+
+    def submit(self, video_info):
+        self._pool.submit(self.process, video_info)
+
+    def _should_stream(self):
+        if self.stream_playback == "always":
+            return True
+        if self.stream_playback != "auto":
+            return False
+        try:
+            return self.video_queue.qsize() == 0
+        except NotImplementedError:
+            return False
+
+    def _watch_stream(self, part_file, done, streamed):
+        """Queue `part_file` for the player once enough of it is on disk, unless the download finishes first."""
+        while not done.wait(0.1):
+            try:
+                size = os.path.getsize(part_file)
+            except OSError:
+                continue
+            if size >= self.stream_start_bytes:
+                self.store.ready(video_id_from_path(part_file), part_file)
+                self.video_queue.put(part_file)
+                streamed.set()
+                metrics.inc("finder_streamed_total")
+                print(f"Streaming download to player after {size} bytes: {part_file}")
+                return
+
+    def process(self, video_info):
+        """Download, pre-render and enqueue one video, releasing the slot from `acquire_slot`."""
+        watcher = None
+        done = threading.Event()
+        streamed = threading.Event()
+        stream = self._should_stream()
+        started_file = None
+
+        def _on_start(filename):
+            nonlocal watcher, started_file
+            started_file = filename
+            self.store.downloading(video_id_from_path(filename), filename)
+            if not stream:
+                return
+            watcher = threading.Thread(
+                target=self._watch_stream, args=(filename + STREAM_SUFFIX, done, streamed),
+                name="stream-watch", daemon=True,
+            )
+            watcher.start()
+
+        try:
+            try:
+                video_file = self.ydl.download_video(video_info, on_start=_on_start)
+            finally:
+                done.set()
+                if watcher is not None:
+                    watcher.join()
+            if video_file is None:
+                print("Download failed, will try again")
+                if started_file is not None and not streamed.is_set():
+                    self.store.done(video_id_from_path(started_file), started_file + STREAM_SUFFIX)
+                return
+            with self._lock:
+                self.download_count += 1
+                download_number = self.download_count
+            print(f"Downloaded video #{download_number}: {video_file}")
+            if streamed.is_set():
+                # The player already has it (and will delete it after playing).
+                metrics.set_gauge("finder_temp_dir_bytes", self.used_bytes())
+                return
+            vid = video_id_from_path(video_file)
+            # Sample a few frames first so black, blank or frozen clips never cost a pre-render or a playback slot.
+            if self.content_gate is not None and self.content_gate.check(vid, video_file) is not None:
+                self.store.done(vid, video_file)
+                return
+            try:
+                source_bytes = os.path.getsize(video_file)
+            except OSError:
+                source_bytes = 0
+            # Transcode now so the player only has to memory-map frames,
+            # then drop the much larger source file.
+            with metrics.span("finder_prerender"):
+                clip_file = prerender_video(video_file, resolution=self.resolution)
+            if clip_file is not None:
+                delete_video(video_file)
+                video_file = clip_file
+                self._record_bytes_per_second(source_bytes, prerendered_seconds(clip_file))
+            else:
+                print("Pre-render failed, queueing source video instead")
+            # Before readying: every ready clip is already queued, so only this one may be evicted.
+            if not self.store.enforce_quota(self.byte_budget, vid):
+                print(f"Temp dir over quota, dropping new clip {vid}")
+                self.store.done(vid, video_file)
+                metrics.inc("finder_clips_dropped_total", reason="quota")
+                return
+            self.store.ready(vid, video_file)
+            self.video_queue.put(video_file)
+            try:
+                metrics.set_gauge("finder_queue_depth", self.video_queue.qsize())
+            except NotImplementedError:
+                pass
+            metrics.set_gauge("finder_temp_dir_bytes", self.used_bytes())
+            print(f"Added video #{download_number} to queue")
+        except Exception as e:
+            print(f"Download worker failed: {type(e).__name__}: {e}")
+        finally:
+            self.release_slot()
+
+    def release_slot(self):
+        with self._lock:
+            self._in_flight -= 1
+        self._notify()
+
+    def _record_bytes_per_second(self, source_bytes, seconds):
+        if seconds <= 0:
+            return
+        with self._lock:
+            self.bytes_downloaded += source_bytes
+            self.seconds_prepared += seconds
+            average = self.bytes_downloaded / self.seconds_prepared
+        print(f"Clip cost {source_bytes / seconds / 1024:.1f} KiB per displayed second (average {average / 1024:.1f} KiB/s)")
+
+    def run(self):
+        self.ydl.start_background_refill()
+        while True:
+            self.acquire_slot()
+            print("Searching for new unwatched video...")
+            video_info = self.ydl.get_unwatched_video()
+            if video_info:
+                print(f"Found video to download: {video_info.get('id', 'unknown')}")
+                self.submit(video_info)
+            else:
+                print("No suitable video found, will try again")
+                self.release_slot()
@@ -0,0 +1,373 @@
+"""
+Offline finder benchmark: record real YouTube responses once, then replay them.
+
+    python finder_benchmark.py record fixture.json [--videos 20]
+    python finder_benchmark.py replay fixture.json [--videos 20] [--max-seconds 120]
+        [--latency search=400,extract=150,download=500] [--jitter 0.3]
+        [--error-rate 0.05] [--throttle-rate 0.02] [--no-rate-limit] [--seed 1]
+        [--sample-video clip.mp4] [--json out.json]
+
+`record` drives the real finder against the network and saves every search
+and extraction response. `replay` runs the same finder code
+(`get_unwatched_video` + `download_video`) against those responses through a
+stand-in for YoutubeDL, with injected latency and errors, and reports accepted
+videos per minute, extractions per accepted video and time per finder stage.
+A video only counts as accepted once `download_video` has produced it (some
+candidates are still rejected there); `record` doesn't download, so it counts
+candidates.
+`--throttle-rate` makes calls fail like YouTube's HTTP 429 so the request
+scheduler's backoff and circuit breaker can be watched; `--no-rate-limit`
+drops its per-kind rate limits to measure the finder alone.
+"Downloads" copy `--sample-video` (or write a placeholder).
+
+Both modes use a throwaway seen index, query stats and temp dir, so they never
+touch the app's state.
+"""
+import argparse
+import contextlib
+import copy
+import io
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+
+# Isolate all persistent finder state before the modules that read it are imported.
+_STATE_DIR = tempfile.mkdtemp(prefix="finder-benchmark-")
+os.environ["YT_SEEN_INDEX"] = os.path.join(_STATE_DIR, "seen_index.sqlite3")
+os.environ["YT_QUERY_STATS"] = os.path.join(_STATE_DIR, "query_stats.json")
+os.environ["CLIP_STORE_DB"] = os.path.join(_STATE_DIR, "clip_store.sqlite3")
+os.environ["YT_TEMP_DIR"] = os.path.join(_STATE_DIR, "temp")
+
+from yt_dlp import YoutubeDL
+from yt_dlp.utils import DownloadError, ExtractorError
+
+import metrics
+from request_scheduler import RequestScheduler
+from yt_processing import Ydl, YDL_OPTIONS
+
+def _is_search_url(url):
+    return url.startswith("ytsearch") or "/results?" in url
+
+def _video_id(url):
+    parsed = urllib.parse.urlparse(url)
+    vid = urllib.parse.parse_qs(parsed.query).get("v")
+    if vid:
+        return vid[0]
+    return parsed.path.rstrip("/").rsplit("/", 1)[-1] or None
+
+class Fixture:
+    """Recorded search results (in order) and per-video extraction results."""
+    def __init__(self, recorded_at=None, searches=None, videos=None):
+        self.recorded_at = recorded_at or time.time()
+        self.searches = searches or []
+        self.videos = videos or {}
+        self._lock = threading.Lock()
+        self._next_search = 0
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            data = json.load(f)
+        return cls(data.get("recorded_at"), data.get("searches"), data.get("videos"))
+
+    def save(self, path):
+        with self._lock:
+            data = {"recorded_at": self.recorded_at, "searches": self.searches, "videos": self.videos}
+        with open(path, "w") as f:
+            json.dump(data, f)
+
+    def add_search(self, url, result):
+        with self._lock:
+            self.searches.append({"url": url, "result": result})
+
+    def add_video(self, vid, info):
+        with self._lock:
+            self.videos[vid] = info
+
+    def next_search(self):
+        """Recorded searches are served round-robin, whatever the query (queries are random)."""
+        with self._lock:
+            if not self.searches:
+                return {"entries": []}
+            search = self.searches[self._next_search % len(self.searches)]
+            self._next_search += 1
+        return search["result"]
+
+    def video(self, vid):
+        with self._lock:
+            return self.videos.get(vid)
+
+class RecordingYDL:
+    """Real YoutubeDL that also saves every extraction into a Fixture."""
+    def __init__(self, options, fixture):
+        self._ydl = YoutubeDL(options)
+        self.fixture = fixture
+
+    def extract_info(self, url, download=False, process=True):
+        result = self._ydl.extract_info(url, download=download, process=process)
+        if result is None:
+            return result
+        if _is_search_url(url):
+            # Search entries come back lazily; materialize them so they can be saved and still returned.
+            result = dict(result)
+            result["entries"] = list(result.get("entries") or [])
+            self.fixture.add_search(url, YoutubeDL.sanitize_info(result))
+        else:
+            vid = result.get("id") or _video_id(url)
+            if vid:
+                self.fixture.add_video(vid, YoutubeDL.sanitize_info(result))
+        return result
+
+    def process_ie_result(self, info, download=True):
+        return self._ydl.process_ie_result(info, download=download)
+
+    def prepare_filename(self, info):
+        return self._ydl.prepare_filename(info)
+
+    def close(self):
+        self._ydl.close()
+
+class FaultInjector:
+    """
+    Sleeps for a per-call latency (± jitter) and fails a fraction of calls like a flaky network would.
+
+    Another `throttle_rate` of calls fail the way YouTube rejects clients that ask too often.
+    """
+    def __init__(self, latency_ms=None, jitter=0.3, error_rate=0.0, throttle_rate=0.0, seed=None):
+        self.latency_ms = latency_ms or {}
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = {}
+        self.errors = {}
+
+    def before(self, kind):
+        with self._lock:
+            scale = self._rng.uniform(1 - self.jitter, 1 + self.jitter)
+            roll = self._rng.random()
+            fail = roll < self.error_rate
+            throttle = not fail and roll < self.error_rate + self.throttle_rate
+            self.calls[kind] = self.calls.get(kind, 0) + 1
+            if fail or throttle:
+                self.errors[kind] = self.errors.get(kind, 0) + 1
+        time.sleep(max(0.0, self.latency_ms.get(kind, 0) * scale / 1000.0))
+        if fail:
+            raise DownloadError(f"ERROR: [injected] {kind} failed: Connection reset by peer")
+        if throttle:
+            raise DownloadError(f"ERROR: [injected] {kind} failed: HTTP Error 429: Too Many Requests")
+
+class ReplayYDL:
+    """Stand-in for YoutubeDL that answers from a Fixture, through a FaultInjector."""
+    def __init__(self, options, fixture, injector, sample_video=None):
+        self.options = options
+        self.fixture = fixture
+        self.injector = injector
+        self.sample_video = sample_video
+        # Uploads were "recent" when recorded; keep them that way.
+        self._shift = time.time() - fixture.recorded_at
+
+    def _refresh(self, info):
+        info = copy.deepcopy(info)
+        for entry in [info] + [e for e in (info.get("entries") or []) if isinstance(e, dict)]:
+            for key in ("timestamp", "release_timestamp"):
+                if isinstance(entry.get(key), (int, float)):
+                    entry[key] += self._shift
+            if entry.get("upload_date") and entry.get("timestamp"):
+                entry["upload_date"] = time.strftime("%Y%m%d", time.gmtime(entry["timestamp"]))
+        return info
+
+    def extract_info(self, url, download=False, process=True):
+        if _is_search_url(url):
+            self.injector.before("search")
+            return self._refresh(self.fixture.next_search())
+        self.injector.before("extract")
+        vid = _video_id(url)
+        info = self.fixture.video(vid)
+        if info is None:
+            raise DownloadError(f"ERROR: [youtube] {vid}: Video unavailable", (None, ExtractorError("Video unavailable (not recorded)", expected=True), None))
+        return self._refresh(info)
+
+    def prepare_filename(self, info):
+        return self.options["outtmpl"] % {"id": info.get("id"), "ext": info.get("ext") or "mp4"}
+
+    def process_ie_result(self, info, download=True):
+        if download:
+            self.injector.before("download")
+            filename = self.prepare_filename(info)
+            os.makedirs(os.path.dirname(filename), exist_ok=True)
+            if self.sample_video:
+                shutil.copyfile(self.sample_video, filename)
+            else:
+                with open(filename, "wb") as f:
+                    f.write(b"\0" * 1024)
+        return info
+
+    def close(self):
+        pass
+
+def _parse_latency(text):
+    latency = {}
+    for part in (text or "").split(","):
+        if part.strip():
+            kind, _, ms = part.partition("=")
+            latency[kind.strip()] = float(ms)
+    return latency
+
+def _histogram_totals(snap, name):
+    total = 0.0
+    count = 0
+    for h in snap["histograms"]:
+        if h["name"] == name:
+            total += h["sum"]
+            count += h["count"]
+    return total, count
+
+def _counters(snap, name, label):
+    return {c["labels"].get(label, ""): c["value"] for c in snap["counters"] if c["name"] == name}
+
+def _run_finder(ydl, videos, max_seconds, download):
+    """
+    Find (and optionally download) videos on a worker thread until `videos` are accepted.
+
+    With `download`, a video is accepted once it has been downloaded;
+    otherwise every candidate `get_unwatched_video` returns is.
+    Returns (candidate IDs, downloaded paths, seconds).
+    """
+    candidates = []
+    downloaded = []
+
+    def _loop():
+        while len(downloaded if download else candidates) < videos:
+            video = ydl.get_unwatched_video()
+            candidates.append(video.get("id"))
+            if download:
+                video_file = ydl.download_video(video)
+                if video_file is not None:
+                    downloaded.append(video_file)
+
+    started = time.perf_counter()
+    # get_unwatched_video retries forever once the fixture runs dry; the deadline ends the run.
+    worker = threading.Thread(target=_loop, name="finder-benchmark", daemon=True)
+    worker.start()
+    worker.join(timeout=max_seconds)
+    return list(candidates), list(downloaded), time.perf_counter() - started
+
+def _report(candidates, downloaded, seconds, download, injector=None, sessions=None, requests=None):
+    snap = metrics.snapshot()
+    extract_seconds, extractions = _histogram_totals(snap, "finder_extract_seconds")
+    search_seconds, searches = _histogram_totals(snap, "finder_search_seconds")
+    download_seconds, downloads = _histogram_totals(snap, "finder_download_seconds")
+    count = len(downloaded) if download else len(candidates)
+    report = {
+        "candidates": len(candidates),
+        "accepted": count,
+        "seconds": round(seconds, 2),
+        "accepted_per_minute": round(count / seconds * 60.0, 2) if seconds > 0 else None,
+        "downloaded": len(downloaded),
+        "searches": searches,
+        "extractions": extractions,
+        "downloads": downloads,
+        "searches_per_accepted": round(searches / count, 2) if count else None,
+        "extractions_per_accepted": round(extractions / count, 2) if count else None,
+        "stage_seconds": {
+            "search": round(search_seconds, 3),
+            "extract": round(extract_seconds, 3),
+            "download": round(download_seconds, 3),
+        },
+        "prefilter_verdicts": _counters(snap, "finder_prefilter_verdicts_total", "verdict"),
+        "prefilter_rejections": _counters(snap, "finder_prefilter_rejections_total", "reason"),
+        "secondary_rejections": _counters(snap, "finder_secondary_rejections_total", "reason"),
+    }
+    if injector is not None:
+        report["injected_calls"] = dict(injector.calls)
+        report["injected_errors"] = dict(injector.errors)
+    if sessions is not None:
+        report["sessions"] = sessions.stats()
+    if requests is not None:
+        report["requests"] = requests.stats()
+    return report
+
+@contextlib.contextmanager
+def _quiet(verbose):
+    if verbose:
+        yield
+        return
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+def record(args):
+    fixture = Fixture()
+    with _quiet(args.verbose):
+        ydl = Ydl(YDL_OPTIONS, ydl_factory=lambda options: RecordingYDL(options, fixture))
+        candidates, downloaded, seconds = _run_finder(ydl, args.videos, args.max_seconds, download=False)
+    fixture.save(args.fixture)
+    print(f"Recorded {len(fixture.searches)} searches and {len(fixture.videos)} videos to {args.fixture}")
+    return _report(candidates, downloaded, seconds, download=False, sessions=ydl.sessions, requests=ydl.requests)
+
+def replay(args):
+    random.seed(args.seed)
+    fixture = Fixture.load(args.fixture)
+    injector = FaultInjector(
+        _parse_latency(args.latency), jitter=args.jitter, error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate, seed=args.seed,
+    )
+    with _quiet(args.verbose):
+        # None: Ydl builds its usual scheduler from the FINDER_*_RPS settings.
+        requests = RequestScheduler(rates=None) if args.no_rate_limit else None
+        ydl = Ydl(
+            YDL_OPTIONS, ydl_factory=lambda options: ReplayYDL(options, fixture, injector, args.sample_video),
+            request_scheduler=requests,
+        )
+        candidates, downloaded, seconds = _run_finder(ydl, args.videos, args.max_seconds, download=True)
+    return _report(candidates, downloaded, seconds, download=True, injector=injector, sessions=ydl.sessions, requests=ydl.requests)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("mode", choices=("record", "replay"))
+    parser.add_argument("fixture", help="fixture file to write (record) or read (replay)")
+    parser.add_argument("--videos", type=int, default=20, help="stop after this many accepted videos")
+    parser.add_argument("--max-seconds", type=float, default=120, help="stop after this long regardless")
+    parser.add_argument("--latency", default="search=400,extract=150,download=500", help="replay latency per call kind, in ms")
+    parser.add_argument("--jitter", type=float, default=0.3, help="replay latency varies by this fraction either way")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of replayed calls that fail")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="fraction of replayed calls that fail with HTTP 429")
+    parser.add_argument("--no-rate-limit", action="store_true", help="replay without the request scheduler's rate limits")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--sample-video", help="file each replayed download produces")
+    parser.add_argument("--json", help="also write the report to this file")
+    parser.add_argument("--verbose", action="store_true", help="show the finder's own output")
+    args = parser.parse_args(argv)
+
+    try:
+        report = record(args) if args.mode == "record" else replay(args)
+    finally:
+        shutil.rmtree(_STATE_DIR, ignore_errors=True)
+
+    print(f"{report['accepted']} videos accepted in {report['seconds']}s ({report['accepted_per_minute']} per minute) out of {report['candidates']} candidates, {report['downloaded']} downloaded")
+    print(f"  searches: {report['searches']} ({report['searches_per_accepted']} per accepted)")
+    print(f"  extractions: {report['extractions']} ({report['extractions_per_accepted']} per accepted)")
+    print(f"  stage seconds: {report['stage_seconds']}")
+    print(f"  prefilter verdicts: {report['prefilter_verdicts']}")
+    print(f"  prefilter rejections: {report['prefilter_rejections']}")
+    print(f"  secondary rejections: {report['secondary_rejections']}")
+    if "injected_errors" in report:
+        print(f"  injected calls: {report['injected_calls']} errors: {report['injected_errors']}")
+    if "requests" in report:
+        requests = report["requests"]
+        print(f"  requests: {requests['outcomes']} waited {requests['waited_seconds']}s, rates {requests['rates']}")
+        print(f"  circuit: {requests['circuit']}, opened {requests['times_opened']} times")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    return report
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,127 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+
+class FinderService:
+    """
+    Asyncio discovery-and-download engine.
+
+    Search workers keep the candidate reservoir topped up with several queries
+    in flight, vet workers drain it concurrently, and download workers feed the
+    player queue through the DownloadScheduler (which enforces the disk budget).
+    Each stage has its own
+    concurrency limit. Blocking yt-dlp calls run on a thread pool, where the
+    Ydl's RequestScheduler paces them per kind of call and holds them while
+    YouTube is throttling us.
+    """
+    def __init__(self, ydl, scheduler, search_concurrency=2, extract_concurrency=4, download_concurrency=2,
+                 max_pending_candidates=8):
+        self.ydl = ydl
+        self.scheduler = scheduler
+        self.search_concurrency = search_concurrency
+        self.extract_concurrency = extract_concurrency
+        self.download_concurrency = download_concurrency
+        self.max_pending_candidates = max_pending_candidates
+
+        self._executor = ThreadPoolExecutor(
+            max_workers=search_concurrency + extract_concurrency + download_concurrency * 2,
+            thread_name_prefix="finder",
+        )
+        self.search_count = 0
+        self.accepted_count = 0
+
+    async def _call(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    async def _search_worker(self, worker_id):
+        backoff = 0.25
+        while True:
+            # Only search when the candidate reservoir runs low.
+            await self._refill_wanted.wait()
+            query = self.ydl._random_query()
+            self.search_count += 1
+            print(f"[search {worker_id}] Search #{self.search_count} with query: {query}")
+            try:
+                async with self._search_sem:
+                    await self._call(self.ydl.search_into_reservoir, query)
+            except Exception as e:
+                print(f"[search {worker_id}] Search failed: {type(e).__name__}: {e}, retrying in {backoff:.2f}s")
+                await asyncio.sleep(backoff)
+                backoff = min(2.0, backoff * 1.1)
+                continue
+            backoff = 0.25
+
+            if len(self.ydl.reservoir):
+                self._reservoir_ready.set()
+            if not self.ydl.reservoir.is_low():
+                self._refill_wanted.clear()
+
+    async def _vet_worker(self, worker_id):
+        reservoir = self.ydl.reservoir
+        while True:
+            # Don't vet while there are already enough accepted videos waiting.
+            await self._candidates_wanted.wait()
+            item = reservoir.pop(skip=lambda entry: entry.get("id") in self.ydl._seen_ids)
+            if reservoir.is_low():
+                self._refill_wanted.set()
+            if item is None:
+                self._reservoir_ready.clear()
+                await self._reservoir_ready.wait()
+                continue
+
+            entry, confident = item
+            if confident:
+                await self._offer(self.ydl.accept_from_search(entry))
+                continue
+
+            async with self._extract_sem:
+                try:
+                    info = await self._call(self.ydl.vet_entry, entry)
+                except Exception as e:
+                    print(f"[vet {worker_id}] Vetting failed: {type(e).__name__}: {e}")
+                    continue
+            if info is not None:
+                await self._offer(info)
+
+    async def _offer(self, info):
+        self.accepted_count += 1
+        print(f"Accepted video #{self.accepted_count}: {info.get('id', 'unknown')} ({self.search_count} searches so far)")
+        await self._candidates.put(info)
+        self._update_wanted()
+
+    def _update_wanted(self):
+        metrics.set_gauge("finder_pending_candidates", self._candidates.qsize())
+        if self._candidates.qsize() >= self.max_pending_candidates:
+            self._candidates_wanted.clear()
+        else:
+            self._candidates_wanted.set()
+
+    async def _download_worker(self, worker_id):
+        while True:
+            info = await self._candidates.get()
+            self._update_wanted()
+            # Blocks on the shared disk-budget condition, so keep it off the loop thread.
+            await self._call(self.scheduler.acquire_slot)
+            print(f"[download {worker_id}] Downloading: {info.get('id', 'unknown')}")
+            async with self._download_sem:
+                await self._call(self.scheduler.process, info)
+
+    async def run(self):
+        self._search_sem = asyncio.Semaphore(self.search_concurrency)
+        self._extract_sem = asyncio.Semaphore(self.extract_concurrency)
+        self._download_sem = asyncio.Semaphore(self.download_concurrency)
+        self._candidates = asyncio.Queue()
+        self._candidates_wanted = asyncio.Event()
+        self._candidates_wanted.set()
+        self._refill_wanted = asyncio.Event()
+        self._refill_wanted.set()
+        self._reservoir_ready = asyncio.Event()
+
+        workers = [asyncio.create_task(self._search_worker(i)) for i in range(self.search_concurrency)]
+        workers += [asyncio.create_task(self._vet_worker(i)) for i in range(self.extract_concurrency)]
+        workers += [asyncio.create_task(self._download_worker(i)) for i in range(self.download_concurrency)]
+        await asyncio.gather(*workers)
+
+    def run_forever(self):
+        asyncio.run(self.run())
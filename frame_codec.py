@@ -0,0 +1,116 @@
+import numpy as np
+
+# Delta protocol for the SPI link.
+#
+# Every packet starts with a one-byte type:
+# - KEYFRAME: b"K" followed by the full frame (rows * cols * 3 bytes).
+# - DELTA:    b"D" followed by a bitmap of changed rows (one bit per row,
+#             MSB first, see np.packbits) and then the pixel data of just
+#             those rows, top to bottom.
+# A delta with an all-zero bitmap means "nothing changed".
+KEYFRAME = ord("K")
+DELTA = ord("D")
+
+class DeltaEncoder:
+    """
+    Encode frames as keyframes or changed-row deltas against the last frame sent.
+
+    A keyframe is forced every `keyframe_interval` frames (so the panel recovers
+    from any corrupted packet), and whenever a delta would not be smaller than a
+    full frame. Returned packets are views into a reused buffer and are only valid
+    until the next call to `encode`.
+    """
+    def __init__(self, shape=(48, 96, 3), keyframe_interval=30):
+        self.shape = shape
+        self.keyframe_interval = keyframe_interval
+        rows = shape[0]
+        self.row_bytes = int(np.prod(shape[1:]))
+        self.bitmap_bytes = (rows + 7) // 8
+
+        self._prev = np.zeros(shape, dtype=np.uint8)
+        self._diff = np.zeros(shape, dtype=bool)
+        self._have_prev = False
+        self._since_keyframe = 0
+
+        self._packet = bytearray(1 + self.bitmap_bytes + rows * self.row_bytes)
+        self._packet_view = memoryview(self._packet)
+        self._payload = np.frombuffer(self._packet, dtype=np.uint8)
+
+        self.keyframes = 0
+        self.deltas = 0
+        self.bytes_sent = 0
+
+    def encode(self, frame):
+        if self._have_prev and self._since_keyframe < self.keyframe_interval:
+            np.not_equal(frame, self._prev, out=self._diff)
+            changed = self._diff.any(axis=(1, 2))
+            changed_rows = int(np.count_nonzero(changed))
+            size = 1 + self.bitmap_bytes + changed_rows * self.row_bytes
+            if size < 1 + frame.size:
+                packet = self._encode_delta(frame, changed, changed_rows, size)
+                self._since_keyframe += 1
+                self.deltas += 1
+                self.bytes_sent += size
+                return packet
+
+        return self._encode_keyframe(frame)
+
+    def _encode_keyframe(self, frame):
+        size = 1 + frame.size
+        self._packet[0] = KEYFRAME
+        self._payload[1:size].reshape(self.shape)[...] = frame
+        np.copyto(self._prev, frame)
+        self._have_prev = True
+        self._since_keyframe = 0
+        self.keyframes += 1
+        self.bytes_sent += size
+        return self._packet_view[:size]
+
+    def _encode_delta(self, frame, changed, changed_rows, size):
+        self._packet[0] = DELTA
+        self._payload[1:1 + self.bitmap_bytes] = np.packbits(changed)
+        if changed_rows:
+            rows_out = self._payload[1 + self.bitmap_bytes:size].reshape((changed_rows,) + tuple(self.shape[1:]))
+            np.compress(changed, frame, axis=0, out=rows_out)
+            self._prev[changed] = rows_out
+        return self._packet_view[:size]
+
+class DeltaDecoder:
+    """
+    Host-side emulation of the panel firmware's decoder, for testing without hardware.
+    """
+    def __init__(self, shape=(48, 96, 3)):
+        self.shape = shape
+        self.row_bytes = int(np.prod(shape[1:]))
+        self.bitmap_bytes = (shape[0] + 7) // 8
+        self.frame = np.zeros(shape, dtype=np.uint8)
+        self._have_keyframe = False
+
+    def decode(self, packet):
+        data = np.frombuffer(packet, dtype=np.uint8)
+        if len(data) == 0:
+            raise ValueError("Empty packet")
+
+        kind = data[0]
+        if kind == KEYFRAME:
+            if len(data) != 1 + self.frame.size:
+                raise ValueError(f"Keyframe has {len(data) - 1} bytes, expected {self.frame.size}")
+            self.frame[...] = data[1:].reshape(self.shape)
+            self._have_keyframe = True
+            return self.frame
+
+        if kind == DELTA:
+            if not self._have_keyframe:
+                raise ValueError("Delta received before any keyframe")
+            if len(data) < 1 + self.bitmap_bytes:
+                raise ValueError("Delta packet is missing its row bitmap")
+            changed = np.unpackbits(data[1:1 + self.bitmap_bytes])[:self.shape[0]].astype(bool)
+            rows = data[1 + self.bitmap_bytes:]
+            changed_rows = int(np.count_nonzero(changed))
+            if len(rows) != changed_rows * self.row_bytes:
+                raise ValueError(f"Delta has {len(rows)} bytes of rows, expected {changed_rows * self.row_bytes}")
+            if changed_rows:
+                self.frame[changed] = rows.reshape((changed_rows,) + tuple(self.shape[1:]))
+            return self.frame
+
+        raise ValueError(f"Unknown packet type: {kind}")
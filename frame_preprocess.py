@@ -0,0 +1,104 @@
+import os
+import time
+
+import cv2
+import numpy as np
+
+# LED panels respond roughly linearly to PWM duty cycle, while video is
+# gamma-encoded for monitors, so clips look washed out on the panel.
+# MATRIX_GAMMA > 1 darkens the midtones to compensate and MATRIX_BRIGHTNESS
+# scales the result. 1.0/1.0 leaves pixels untouched.
+MATRIX_GAMMA = float(os.getenv("MATRIX_GAMMA", "1.0"))
+MATRIX_BRIGHTNESS = float(os.getenv("MATRIX_BRIGHTNESS", "1.0"))
+
+def build_lut(gamma=MATRIX_GAMMA, brightness=MATRIX_BRIGHTNESS):
+    """256-entry uint8 table applying gamma and brightness, or None if it would be the identity."""
+    if gamma == 1.0 and brightness == 1.0:
+        return None
+    x = np.arange(256, dtype=np.float64) / 255.0
+    return np.clip(brightness * np.power(x, gamma) * 255.0 + 0.5, 0, 255).astype(np.uint8)
+
+PANEL_LUT = build_lut()
+
+def crop_rect(width, height, aspect_ratio):
+    """(top, bottom, left, right) of the largest centered region with `aspect_ratio`."""
+    if width / height > aspect_ratio:
+        new_width = min(width, max(1, int(height * aspect_ratio)))
+        left = (width - new_width) // 2
+        return 0, height, left, left + new_width
+    if width / height < aspect_ratio:
+        new_height = min(height, max(1, int(width / aspect_ratio)))
+        top = (height - new_height) // 2
+        return top, top + new_height, 0, width
+    return 0, height, 0, width
+
+def ffmpeg_crop_scale(resolution):
+    """ffmpeg filter chain doing the same centered crop and area downscale as FramePreprocessor."""
+    width, height = resolution
+    aspect = width / height
+    return (
+        f"crop='min(iw,ih*{aspect:.6f})':'min(ih,iw/{aspect:.6f})',"
+        f"scale={width}:{height}:flags=area"
+    )
+
+class FramePreprocessor:
+    """
+    Turns decoded BGR frames of one video into panel-ready RGB frames.
+
+    The crop rectangle is worked out once (again only if the frame size
+    changes) and output buffers are allocated up front. Each step writes into
+    a preallocated buffer: crop is a view, resize writes into a scratch buffer,
+    and the BGR->RGB swap writes into the output, to which the gamma LUT is then
+    applied in place. Outputs rotate through `ring_size` buffers, so a returned
+    frame stays valid for the next `ring_size - 1` calls; callers that keep
+    frames longer must copy them.
+    """
+    def __init__(self, resolution=(96, 48), lut=PANEL_LUT, ring_size=3):
+        self.resolution = resolution
+        self.lut = lut
+        width, height = resolution
+        self._scratch = np.empty((height, width, 3), dtype=np.uint8)
+        self._ring = [np.empty((height, width, 3), dtype=np.uint8) for _ in range(ring_size)]
+        self._next = 0
+        self._source_shape = None
+        self._rect = None
+
+    def _setup(self, shape):
+        height, width = shape[:2]
+        self._rect = crop_rect(width, height, self.resolution[0] / self.resolution[1])
+        self._source_shape = shape
+
+    def process(self, frame, stats=None, t0=None):
+        """
+        Preprocess one BGR frame. Returns a view into the output ring.
+
+        With `stats`, resize and convert CPU time is recorded; pass the time
+        already taken as `t0` (thread time) to have it counted as "decode".
+        """
+        if frame.shape != self._source_shape:
+            self._setup(frame.shape)
+        top, bottom, left, right = self._rect
+        out = self._ring[self._next]
+        self._next = (self._next + 1) % len(self._ring)
+
+        t1 = time.thread_time() if stats is not None else 0.0
+        cv2.resize(frame[top:bottom, left:right], self.resolution, dst=self._scratch, interpolation=cv2.INTER_AREA)
+        t2 = time.thread_time() if stats is not None else 0.0
+        cv2.cvtColor(self._scratch, cv2.COLOR_BGR2RGB, dst=out)
+        if self.lut is not None:
+            cv2.LUT(out, self.lut, dst=out)
+        if stats is not None:
+            t3 = time.thread_time()
+            if t0 is not None:
+                stats.add("decode", t1 - t0)
+            stats.add("resize", t2 - t1)
+            stats.add("convert", t3 - t2)
+        return out
+
+def apply_lut(frames, lut=PANEL_LUT):
+    """Apply `lut` in place to a contiguous (..., 3) uint8 array of frames in one call."""
+    if lut is None or frames.size == 0:
+        return frames
+    flat = frames.reshape(-1, frames.shape[-2], frames.shape[-1])
+    cv2.LUT(flat, lut, dst=flat)
+    return frames
@@ -0,0 +1,128 @@
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# Shared-memory frame ring between the decoder process and the player.
+#
+# Layout of the shared block:
+# - control: int64[4] = write_seq, read_seq, cancelled_clip, slot count
+# - meta:    one record per slot: clip id, pts in ms, end-of-clip flag
+# - frames:  one (48, 96, 3) uint8 frame per slot
+#
+# There is exactly one writer (the decoder) and one reader (the player), so no
+# locks are needed: the writer only ever advances write_seq and the reader
+# read_seq, each after it has finished with the slot in question.
+_CONTROL = np.dtype((np.int64, 4))
+_META = np.dtype([("clip", np.int64), ("pts_ms", np.float64), ("end", np.int64)])
+WRITE_SEQ, READ_SEQ, CANCELLED_CLIP, SLOTS = 0, 1, 2, 3
+
+class FrameRing:
+    """
+    Single-producer/single-consumer ring of frames plus timestamps in shared memory.
+
+    Create it in one process (no `name`) and attach from the other by passing
+    `ring.name`; the slot count is stored in the ring itself. The reader gets
+    frames as views into shared memory, so a frame is only valid until
+    `advance()` is called.
+    """
+    def __init__(self, name=None, slots=64, shape=(48, 96, 3), poll_seconds=0.001):
+        self.shape = tuple(shape)
+        self.poll_seconds = poll_seconds
+        frame_bytes = int(np.prod(self.shape))
+
+        self._owner = name is None
+        if self._owner:
+            size = _CONTROL.itemsize + (_META.itemsize + frame_bytes) * slots
+            self._shm = shared_memory.SharedMemory(create=True, size=size)
+        else:
+            self._shm = shared_memory.SharedMemory(name=name)
+        buf = self._shm.buf
+        self._control = np.ndarray((4,), dtype=np.int64, buffer=buf, offset=0)
+        if self._owner:
+            self._control[:] = 0
+            self._control[SLOTS] = slots
+        self.slots = slots = int(self._control[SLOTS])
+        meta_offset = _CONTROL.itemsize
+        frames_offset = meta_offset + _META.itemsize * slots
+        self._meta = np.ndarray((slots,), dtype=_META, buffer=buf, offset=meta_offset)
+        self._frames = np.ndarray((slots,) + self.shape, dtype=np.uint8, buffer=buf, offset=frames_offset)
+
+    @property
+    def name(self):
+        return self._shm.name
+
+    def __len__(self):
+        return int(self._control[WRITE_SEQ] - self._control[READ_SEQ])
+
+    # Writer side
+
+    def _wait_for_space(self, clip_id, timeout):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while len(self) >= self.slots:
+            if self._control[CANCELLED_CLIP] >= clip_id:
+                return False
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(self.poll_seconds)
+        return self._control[CANCELLED_CLIP] < clip_id
+
+    def put(self, clip_id, pts_ms, frame, timeout=None):
+        """Append a frame, waiting while the ring is full. False if the reader gave up on `clip_id`."""
+        if not self._wait_for_space(clip_id, timeout):
+            return False
+        seq = int(self._control[WRITE_SEQ])
+        slot = seq % self.slots
+        self._frames[slot] = frame
+        self._meta[slot] = (clip_id, pts_ms, 0)
+        # Publish only after the slot is fully written.
+        self._control[WRITE_SEQ] = seq + 1
+        return True
+
+    def end_clip(self, clip_id, timeout=None):
+        """Mark the end of `clip_id` so the reader stops waiting for more of it."""
+        if not self._wait_for_space(clip_id, timeout):
+            return False
+        seq = int(self._control[WRITE_SEQ])
+        self._meta[seq % self.slots] = (clip_id, 0.0, 1)
+        self._control[WRITE_SEQ] = seq + 1
+        return True
+
+    # Reader side
+
+    def peek(self, timeout=None):
+        """
+        Oldest unread slot as (clip_id, pts_ms, is_end, frame), or None on timeout.
+
+        The frame is a view into shared memory; call `advance()` when done with it.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while len(self) <= 0:
+            if deadline is not None and time.monotonic() >= deadline:
+                return None
+            time.sleep(self.poll_seconds)
+        slot = int(self._control[READ_SEQ]) % self.slots
+        meta = self._meta[slot]
+        return int(meta["clip"]), float(meta["pts_ms"]), bool(meta["end"]), self._frames[slot]
+
+    def advance(self):
+        self._control[READ_SEQ] += 1
+
+    def cancel(self, clip_id):
+        """Tell the writer to stop producing `clip_id` (and anything older)."""
+        if clip_id > self._control[CANCELLED_CLIP]:
+            self._control[CANCELLED_CLIP] = clip_id
+
+    def close(self):
+        # Views must go before the mapping can be closed.
+        self._control = self._meta = self._frames = None
+        try:
+            self._shm.close()
+        except BufferError:
+            # A reader still holds a frame; the mapping goes when the process exits.
+            pass
+        if self._owner:
+            try:
+                self._shm.unlink()
+            except FileNotFoundError:
+                pass
@@ -1,60 +1,161 @@
-import multiprocessing as mp
 import time
-import numpy as np
-import cv2
+# Taken before anything else is imported, for the time-to-first-frame metric.
+PROCESS_STARTED = time.monotonic()
+
+import multiprocessing as mp
 import os
+import queue
+import signal
+import sys
+
+import numpy as np
 
 from matrix_driver import Matrix
-from yt_processing import Ydl, YDL_OPTIONS, iter_video_frames, delete_video
+import metrics
+from playback import FrameStats, STREAM_SUFFIX, iter_prerendered_frames, iter_ring_frames, is_prerendered, is_streaming, video_id_from_path
+from frame_ring import FrameRing
+from clip_store import ClipStore, WarmClips, TEMP_DIR
+from seen_index import SeenIndex
+
+# The player only needs numpy to play pre-rendered clips. OpenCV and yt-dlp
+# take seconds to import on a Pi, so they are imported inside the process that
+# uses them: the finder and the decoder (both forked before loading them).
+
+def _metrics_port(offset=0):
+    port = os.getenv("METRICS_PORT", "").strip()
+    return int(port) + offset if port else None
 
-def video_finder(video_queue):
+def video_finder(video_queue, space_freed):
         print("Video finder process started")
+        from yt_processing import Ydl, YDL_OPTIONS
+        from download_scheduler import DownloadScheduler
+        from finder_service import FinderService
+        metrics.start_exporter("finder", port=_metrics_port(offset=1))
         ydl = Ydl(YDL_OPTIONS)
-        video_download_count = 0
+        download_concurrency = int(os.getenv("DOWNLOAD_CONCURRENCY", "2"))
+        # Skips black, blank and static clips after download (CONTENT_GATE=0 disables it).
+        content_gate = None
+        if os.getenv("CONTENT_GATE", "1").strip() not in ("0", "false", "False", "no", "NO"):
+            from content_gate import ContentGate
+            content_gate = ContentGate()
+        scheduler = DownloadScheduler(
+            ydl,
+            video_queue,
+            space_freed,
+            max_in_flight=download_concurrency,
+            byte_budget=int(os.getenv("TEMP_DIR_BUDGET_MB", "256")) * 1024 * 1024,
+            # "auto" streams downloads to the player only while it has nothing queued.
+            stream_playback=os.getenv("STREAM_PLAYBACK", "auto").strip().lower(),
+            content_gate=content_gate,
+        )
+        if os.getenv("FINDER_MODE", "async").strip().lower() == "threads":
+            scheduler.run()
+            return
+
+        service = FinderService(
+            ydl,
+            scheduler,
+            search_concurrency=int(os.getenv("SEARCH_CONCURRENCY", "2")),
+            extract_concurrency=int(os.getenv("EXTRACT_CONCURRENCY", "4")),
+            download_concurrency=download_concurrency,
+        )
+        service.run_forever()
+
+def clip_fetcher(discovery_url, video_queue, space_freed):
+        # Display node: clips come from a discovery server (see discovery.py)
+        # instead of a finder of our own.
+        print("Clip fetcher process started")
+        from discovery import fetch_clips
+        fetch_clips(
+            discovery_url,
+            video_queue,
+            space_freed,
+            node=os.getenv("NODE_NAME", "").strip() or None,
+            prefetch=int(os.getenv("PREFETCH_CLIPS", "2")),
+        )
+
+def frame_decoder(ring_name, decode_requests):
+        # Decodes clips that weren't pre-rendered (streams, failed pre-renders) on
+        # its own core; frames reach the player through the shared-memory ring.
+        print("Frame decoder process started")
+        from yt_processing import decode_into_ring
+        ring = FrameRing(name=ring_name)
         while True:
-            if video_queue.full():
-                print("Video queue is full, waiting...")
-                time.sleep(0.05)
-                continue
-            print("Searching for new unwatched video...")
-            video_info = ydl.get_unwatched_video()
-            if video_info:
-                print(f"Found video to download: {video_info.get('id', 'unknown')}")
-                video_file = ydl.download_video(video_info)
-                if video_file is not None:
-                    video_download_count += 1
-                    print(f"Downloaded video #{video_download_count}: {video_file}")
-                    video_queue.put(video_file)
-                    print(f"Added video #{video_download_count} to queue")
-                else:
-                    print("Download failed, will try again")
-            else:
-                print("No suitable video found, will try again")
+            clip_id, video_file = decode_requests.get()
+            try:
+                count = decode_into_ring(ring, clip_id, video_file, resolution=(96, 48))
+                print(f"Decoded {count} frames of clip {clip_id}: {video_file}")
+            except Exception as e:
+                print(f"Decoder failed on {video_file}: {type(e).__name__}: {e}")
+                ring.end_clip(clip_id)
 
 BLANK_FRAME = np.ones((48, 96, 3), dtype=np.uint8) * 255
 STARTUP_IMAGE_PATH = os.path.join(os.path.dirname(__file__), "loading.png")
-STARTUP_FRAME = cv2.cvtColor(cv2.imread(STARTUP_IMAGE_PATH), cv2.COLOR_BGR2RGB)
+
+def load_startup_frame():
+    # Only shown when there is nothing to play yet, so OpenCV is loaded on demand.
+    import cv2
+    image = cv2.imread(STARTUP_IMAGE_PATH)
+    if image is None:
+        print(f"Startup image not found: {STARTUP_IMAGE_PATH}")
+        return BLANK_FRAME
+    return cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+
+metrics.describe("player_time_to_first_frame_seconds", "Seconds from process start to the first frame of a warm clip or of a new (fresh) one.")
+
 class App:
     def __init__(self, matrix):
         print("Initializing App...")
         self.matrix = matrix
 
         # NOTE: Keep large frame data in-process; only pass small messages (file paths) across processes.
-        print("Creating video queue with maxsize 10")
-        self.video_queue = mp.Queue(maxsize=10)
-        print("Starting video finder process")
-        self.video_finder_process = mp.Process(target=video_finder, args=(self.video_queue,))
+        # The finder limits itself by bytes on disk rather than queue length; we
+        # notify `space_freed` whenever we delete a played clip.
+        print("Creating video queue")
+        self.video_queue = mp.Queue()
+        self.space_freed = mp.Condition()
+
+        # Clean up after a crash before the finder starts writing again: finished
+        # clips from the last run go straight back in the queue, the rest is purged.
+        self.clip_store = ClipStore(TEMP_DIR)
+        for clip_file in self.clip_store.recover(is_prerendered):
+            self.video_queue.put(clip_file)
+        # DISCOVERY_URL makes this a display node that plays clips found by a
+        # central discovery server rather than searching itself.
+        self.discovery_url = os.getenv("DISCOVERY_URL", "").strip()
+        if self.discovery_url:
+            print(f"Starting clip fetcher process for {self.discovery_url}")
+            self.video_finder_process = mp.Process(target=clip_fetcher, args=(self.discovery_url, self.video_queue, self.space_freed))
+        else:
+            print("Starting video finder process")
+            self.video_finder_process = mp.Process(target=video_finder, args=(self.video_queue, self.space_freed))
         self.video_finder_process.start()
 
+        # Non-pre-rendered clips are decoded in a separate process (DECODER_PROCESS=0 decodes inline).
+        self.frame_ring = None
+        if os.getenv("DECODER_PROCESS", "1").strip() not in ("0", "false", "False", "no", "NO"):
+            print("Starting frame decoder process")
+            self.frame_ring = FrameRing(slots=int(os.getenv("FRAME_RING_SLOTS", "64")))
+            self.decode_requests = mp.Queue()
+            self.frame_decoder_process = mp.Process(target=frame_decoder, args=(self.frame_ring.name, self.decode_requests), daemon=True)
+            self.frame_decoder_process.start()
+        self.clip_id = 0
+
+        # A few already played clips kept from earlier runs, shown while there
+        # is nothing new to play (WARM_CLIPS=0 disables them).
+        self.warm_clips = WarmClips(
+            max_clips=int(os.getenv("WARM_CLIPS", "3")),
+            refresh_seconds=float(os.getenv("WARM_CLIP_REFRESH_MINUTES", "60")) * 60,
+        )
+        self.first_frame = {}
+
+        # The SPI link has no chip-select, so reset the panel after its first
+        # frame to resync the firmware with the bus.
         print("Setting blank frame and resetting matrix")
         self.matrix.set_pixels(BLANK_FRAME)
+        self.matrix.writer.flush()
         self.matrix.reset()
-        time.sleep(1)
-
-        print("Displaying startup frame")
-        self.matrix.set_pixels(STARTUP_FRAME)
-        time.sleep(4)
-        print("App initialization complete")
+        print(f"App initialization complete after {time.monotonic() - PROCESS_STARTED:.2f}s")
 
     def _get_buffered_videos(self):
         try:
@@ -63,32 +164,143 @@ class App:
             # Some platforms don't implement qsize() for multiprocessing.Queue
             return 0
 
+    def _next_clip(self):
+        """Next clip and whether it is a warm one: queued clips first, then warm clips, else wait for the finder."""
+        try:
+            return self.video_queue.get_nowait(), False
+        except queue.Empty:
+            pass
+        warm_file = self.warm_clips.next()
+        if warm_file is not None:
+            return warm_file, True
+        if not self.first_frame:
+            print("Displaying startup frame")
+            self.matrix.set_pixels(load_startup_frame())
+            print("Waiting for first downloaded video...")
+        return self.video_queue.get(), False
+
+    def _record_first_frame(self, warm):
+        source = "warm" if warm else "fresh"
+        if source in self.first_frame:
+            return
+        # Measured when the frame is handed to the writer thread.
+        seconds = self.first_frame[source] = time.monotonic() - PROCESS_STARTED
+        metrics.set_gauge("player_time_to_first_frame_seconds", seconds, source=source)
+        print(f"Time to first {source} frame: {seconds:.2f}s")
+
+    def _finish_clip(self, video_id, video_file, played):
+        # A clip that played fine may be kept as a warm clip; otherwise it goes.
+        if not (played and self.warm_clips.keep(video_file)):
+            print(f"Deleting video file: {video_file}")
+        if is_streaming(video_file):
+            # The download may have finished (and been renamed) while we played it.
+            self.clip_store.done(video_id, video_file, video_file[:-len(STREAM_SUFFIX)])
+        else:
+            self.clip_store.done(video_id, video_file)
+        with self.space_freed:
+            self.space_freed.notify_all()
+
+    def _record_clip_metrics(self, stats, frame_count, replaced_before):
+        metrics.inc("player_frames_total", frame_count)
+        for stage, seconds in stats.stage_cpu.items():
+            metrics.inc("player_stage_cpu_seconds_total", seconds, stage=stage)
+            if frame_count:
+                metrics.set_gauge("player_stage_ms_per_frame", seconds * 1000.0 / frame_count, stage=stage)
+        metrics.inc("player_late_frames_total", stats.late_frames)
+        # Frames the pacing loop skipped to stay in real time.
+        metrics.inc("player_dropped_frames_total", stats.dropped_frames, stage="decode")
+        # Frames the SPI writer replaced before it got to send them.
+        metrics.inc("player_dropped_frames_total", self.matrix.writer.frames_replaced - replaced_before, stage="write")
+
     def run(self):
-        print("Waiting for first downloaded video...")
+        metrics.start_exporter("player", port=_metrics_port())
+        # Record played IDs in the same index the finder uses to skip videos;
+        # on a display node that index lives on the discovery server.
+        if self.discovery_url:
+            from discovery import PlayedReporter
+            seen_index = PlayedReporter(self.discovery_url, node=os.getenv("NODE_NAME", "").strip() or None)
+        else:
+            seen_index = SeenIndex()
         video_count = 0
         while True:
             buffered_count = self._get_buffered_videos()
+            metrics.set_gauge("player_queue_depth", buffered_count)
             if buffered_count < 2:
                 print(f"Running out of videos - buffered: {buffered_count}")
-            video_file = self.video_queue.get()
+            video_file, warm = self._next_clip()
             video_count += 1
-            print(f"Playing video #{video_count}: {video_file}")
+            print(f"Playing {'warm clip' if warm else 'video'} #{video_count}: {video_file}")
+            video_id = video_id_from_path(video_file)
+            if not warm:
+                self.clip_store.playing(video_id, video_file)
 
+            frame_count = 0
+            played = False
+            failed = False
             try:
                 print(f"Starting frame iteration for video #{video_count}")
-                frame_count = 0
+                stats = FrameStats()
+                replaced_before = self.matrix.writer.frames_replaced
                 # Pace playback to the video's real timestamps/FPS.
-                for frame in iter_video_frames(video_file, resolution=(96, 48)):
+                if is_prerendered(video_file):
+                    frames = iter_prerendered_frames(video_file, stats=stats)
+                elif self.frame_ring is not None:
+                    self.clip_id += 1
+                    self.decode_requests.put((self.clip_id, video_file))
+                    frames = iter_ring_frames(self.frame_ring, self.clip_id, stats=stats)
+                else:
+                    from yt_processing import iter_video_frames
+                    frames = iter_video_frames(video_file, resolution=(96, 48), stats=stats)
+                for frame in frames:
+                    t0 = time.perf_counter()
                     self.matrix.set_pixels(frame)
+                    metrics.observe("player_frame_write_seconds", time.perf_counter() - t0)
                     frame_count += 1
+                    if frame_count == 1:
+                        self._record_first_frame(warm)
+                    # A warm clip gives way as soon as the finder delivers something new.
+                    if warm and frame_count % 30 == 0 and not self.video_queue.empty():
+                        print("New video ready, ending warm clip early")
+                        break
+                self._record_clip_metrics(stats, frame_count, replaced_before)
                 print(f"Finished playing video #{video_count} - {frame_count} frames displayed")
+                played = frame_count > 0
+                failed = not played
+                if not warm:
+                    seen_index.mark_played(video_id)
             except Exception as e:
                 print(f"Error playing video #{video_count}: {type(e).__name__}: {e}")
+                failed = True
             finally:
-                print(f"Deleting video file: {video_file}")
-                delete_video(video_file)
+                if warm:
+                    # Warm clips stay for the next start; drop one only if it can't be
+                    # played, not because we were stopped in the middle of it.
+                    if failed:
+                        print(f"Discarding unplayable warm clip: {video_file}")
+                        self.warm_clips.discard(video_file)
+                else:
+                    self._finish_clip(video_id, video_file, played)
+
+    def close(self):
+        # Not a daemon, so multiprocessing would wait for it forever at exit.
+        # Whatever it was downloading is cleaned up by ClipStore.recover() next start.
+        if self.video_finder_process.is_alive():
+            self.video_finder_process.terminate()
+            self.video_finder_process.join(timeout=5)
+        # The ring lives in /dev/shm until it is unlinked, across restarts too.
+        if self.frame_ring is not None:
+            if self.frame_decoder_process.is_alive():
+                self.frame_decoder_process.terminate()
+                self.frame_decoder_process.join(timeout=5)
+            self.frame_ring.close()
+            self.frame_ring = None
 
 if __name__ == "__main__":
     print("Starting up...")
+    # Stopping the service sends SIGTERM; exit normally so the cleanup below runs.
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
     app = App(Matrix((96, 48)))
-    app.run()
+    try:
+        app.run()
+    finally:
+        app.close()
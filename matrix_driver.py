@@ -1,11 +1,92 @@
-import cv2
 import numpy as np
-import spidev
-import RPi.GPIO as gpio
+import os
+import threading
 import time
 
-class Matrix:
-    def __init__(self, _):
+from frame_codec import DeltaEncoder, DeltaDecoder
+
+FRAME_SHAPE = (48, 96, 3)
+
+class FrameWriter:
+    """
+    Sends frames to SPI from a dedicated thread.
+
+    Two preallocated frame buffers: the writer thread sends one while the caller
+    copies the next frame into the other. The hand-off is a single-slot mailbox,
+    so if the bus falls behind, the pending frame is replaced by the newest one
+    instead of queueing up. No per-frame allocations happen on either side.
+    """
+    def __init__(self, write_fn, shape=FRAME_SHAPE, encode_fn=None):
+        self._write_fn = write_fn
+        # Optional packet encoder (e.g. DeltaEncoder.encode), run on the writer thread.
+        self._encode_fn = encode_fn
+        self._buffers = [np.zeros(shape, dtype=np.uint8), np.zeros(shape, dtype=np.uint8)]
+        # memoryviews are created once; spidev accepts any buffer-protocol object.
+        self._views = [memoryview(b).cast("B") for b in self._buffers]
+        self._sending = None   # index of the buffer the writer thread is sending
+        self._pending = None   # index of the buffer waiting to be sent
+        self._cond = threading.Condition()
+        self._closed = False
+        self.frames_written = 0
+        self.frames_replaced = 0
+
+        self._thread = threading.Thread(target=self._run, name="spi-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, pixels):
+        with self._cond:
+            # Fill whichever buffer the writer thread isn't currently sending.
+            index = 1 if self._sending == 0 else 0
+            if self._pending is not None:
+                self.frames_replaced += 1
+            np.copyto(self._buffers[index], pixels)
+            self._pending = index
+            self._cond.notify()
+
+    def flush(self, timeout=1.0):
+        """Wait until the pending frame (if any) has been written."""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while (self._pending is not None or self._sending is not None) and time.monotonic() < deadline:
+                self._cond.wait(timeout=0.005)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._pending is None and not self._closed:
+                    self._cond.wait()
+                if self._pending is None:
+                    return
+                index = self._pending
+                self._pending = None
+                self._sending = index
+            try:
+                if self._encode_fn is not None:
+                    self._write_fn(self._encode_fn(self._buffers[index]))
+                else:
+                    self._write_fn(self._views[index])
+                self.frames_written += 1
+            except Exception as e:
+                print(f"Error writing to SPI: {type(e).__name__}: {e}")
+            finally:
+                with self._cond:
+                    self._sending = None
+                    self._cond.notify_all()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout=1)
+
+class SpiBackend:
+    """The real panel: frames go out over SPI, reset is a GPIO pulse."""
+    def __init__(self):
+        # Imported here so the module loads on machines without the Pi libraries.
+        import spidev
+        import RPi.GPIO as gpio
+        self._gpio = gpio
+
         self.reset_pin = 14
 
         self.spi = spidev.SpiDev()
@@ -14,24 +95,11 @@ class Matrix:
         self.spi.mode = 0b11
         self.spi.max_speed_hz = 16_000_000
 
-        self.reset()
-        print("Initializing matrix...")
-
-    def __del__(self):
-        self.spi.close()
-        self.reset()
-
-    def set_pixels(self, pixels):
-        if pixels.shape == (48, 96, 3):
-            data = pixels.tobytes()
-            try:
-                self.spi.writebytes2(data)
-            except Exception as e:
-                print(f"Error writing to SPI: {type(e).__name__}: {e}")
-        else:
-            print(f"Invalid pixel shape: {pixels.shape}, expected (48, 96, 3)")
+    def write(self, data):
+        self.spi.writebytes2(data)
 
     def reset(self):
+        gpio = self._gpio
         gpio.setmode(gpio.BCM)
         gpio.setup(self.reset_pin, gpio.OUT)
         gpio.output(self.reset_pin, gpio.LOW)
@@ -40,20 +108,103 @@ class Matrix:
         gpio.cleanup()
         time.sleep(0.5)
 
-# import cv2
-# class Matrix:
-#     def __init__(self, size):
-#         pass
+    def close(self):
+        self.spi.close()
+
+class NullBackend:
+    """Discards frames, recording only when each write happened and how big it was."""
+    def __init__(self):
+        self.writes = []
+
+    def write(self, data):
+        self.writes.append((time.perf_counter(), len(data)))
+
+    def reset(self):
+        pass
+
+    def close(self):
+        pass
+
+class FramebufferBackend:
+    """
+    Keeps the panel's current image in memory, as the firmware would.
+
+    Accepts raw frames as well as delta-protocol packets.
+    """
+    def __init__(self, shape=FRAME_SHAPE):
+        self.shape = shape
+        self._decoder = DeltaDecoder(shape)
+        self.frame = self._decoder.frame
+        self.frames_received = 0
 
-#     def set_pixels(self, pixels):
-#         pixels = cv2.cvtColor(pixels, cv2.COLOR_RGB2BGR)
-#         cv2.namedWindow("Matrix Emulator", cv2.WINDOW_NORMAL)
-#         cv2.resizeWindow("Matrix Emulator", 750, 375)
-#         cv2.imshow("Matrix Emulator", pixels)
+    def write(self, data):
+        if len(data) == self.frame.size:
+            self.frame[...] = np.frombuffer(data, dtype=np.uint8).reshape(self.shape)
+        else:
+            self._decoder.decode(data)
+        self.frames_received += 1
+
+    def reset(self):
+        self.frame[...] = 0
+
+    def close(self):
+        pass
 
-#         if cv2.waitKey(1) & 0xFF == ord("q"):
-#             cv2.destroyAllWindows()
-#             exit(0)
+class WindowBackend(FramebufferBackend):
+    """Shows the framebuffer in an OpenCV window (desktop emulator)."""
+    def write(self, data):
+        import cv2
+        super().write(data)
+        # OpenCV windows must be driven from one thread; this runs on the writer thread.
+        cv2.namedWindow("Matrix Emulator", cv2.WINDOW_NORMAL)
+        cv2.resizeWindow("Matrix Emulator", 750, 375)
+        cv2.imshow("Matrix Emulator", cv2.cvtColor(self.frame, cv2.COLOR_RGB2BGR))
+        if cv2.waitKey(1) & 0xFF == ord("q"):
+            cv2.destroyAllWindows()
+            os._exit(0)
 
-#     def reset(self):
-#         pass
\ No newline at end of file
+MATRIX_BACKENDS = {
+    "spi": SpiBackend,
+    "null": NullBackend,
+    "framebuffer": FramebufferBackend,
+    "window": WindowBackend,
+}
+
+def make_backend(name):
+    try:
+        return MATRIX_BACKENDS[name]()
+    except KeyError:
+        raise ValueError(f"Unknown matrix backend {name!r}, expected one of {sorted(MATRIX_BACKENDS)}")
+
+class Matrix:
+    def __init__(self, _, backend=None):
+        # Backend is picked by MATRIX_BACKEND (spi, null, framebuffer, window) unless given.
+        if backend is None:
+            backend = make_backend(os.getenv("MATRIX_BACKEND", "spi"))
+        self.backend = backend
+
+        # Optional delta protocol: only changed rows are sent, with a periodic
+        # keyframe. Needs matching panel firmware, so it's off by default.
+        self.encoder = None
+        if os.getenv("MATRIX_DELTA", "").strip() in ("1", "true", "True", "yes", "YES"):
+            self.encoder = DeltaEncoder(FRAME_SHAPE, keyframe_interval=int(os.getenv("MATRIX_KEYFRAME_INTERVAL", "30")))
+
+        # Bus writes happen on their own thread so playback pacing never waits on SPI.
+        self.writer = FrameWriter(self.backend.write, encode_fn=self.encoder.encode if self.encoder else None)
+
+        self.reset()
+        print("Initializing matrix...")
+
+    def __del__(self):
+        self.writer.close()
+        self.backend.close()
+        self.reset()
+
+    def set_pixels(self, pixels):
+        if pixels.shape == FRAME_SHAPE:
+            self.writer.submit(pixels)
+        else:
+            print(f"Invalid pixel shape: {pixels.shape}, expected {FRAME_SHAPE}")
+
+    def reset(self):
+        self.backend.reset()
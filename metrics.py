@@ -0,0 +1,171 @@
+"""
+Lightweight in-process metrics: counters, gauges, histograms and timing spans.
+
+Each process (finder, player) keeps its own registry and, once `start_exporter`
+is called, periodically writes it to `<METRICS_DIR>/<role>.json` and
+`<role>.prom` (Prometheus text format). It can also serve both over HTTP.
+Recording a value is a dict update under a lock. Per-entry chatter should go
+through `debug`, which prints only when VERBOSE=1.
+"""
+import bisect
+import contextlib
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+METRICS_DIR = os.getenv("METRICS_DIR", os.path.join(BASE_DIR, "metrics"))
+VERBOSE = os.getenv("VERBOSE", "").strip() in ("1", "true", "True", "yes", "YES")
+
+# Seconds; covers per-frame work (sub-ms) up to slow downloads.
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_lock = threading.Lock()
+_counters = {}
+_gauges = {}
+_histograms = {}
+_help = {}
+
+def debug(message):
+    if VERBOSE:
+        print(message)
+
+def _key(name, labels):
+    return (name, tuple(sorted(labels.items())))
+
+def inc(name, value=1, **labels):
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+def set_gauge(name, value, **labels):
+    with _lock:
+        _gauges[_key(name, labels)] = value
+
+def observe(name, value, buckets=DEFAULT_BUCKETS, **labels):
+    key = _key(name, labels)
+    with _lock:
+        hist = _histograms.get(key)
+        if hist is None:
+            hist = _histograms[key] = {"buckets": tuple(buckets), "counts": [0] * (len(buckets) + 1), "sum": 0.0, "count": 0}
+        hist["counts"][bisect.bisect_left(hist["buckets"], value)] += 1
+        hist["sum"] += value
+        hist["count"] += 1
+
+@contextlib.contextmanager
+def span(name, **labels):
+    """Time a block into the `<name>_seconds` histogram; failures also count `<name>_errors_total`."""
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        inc(f"{name}_errors_total", **labels)
+        raise
+    finally:
+        observe(f"{name}_seconds", time.perf_counter() - start, **labels)
+
+def describe(name, text):
+    _help[name] = text
+
+def snapshot():
+    with _lock:
+        return {
+            "time": time.time(),
+            "counters": [{"name": n, "labels": dict(l), "value": v} for (n, l), v in sorted(_counters.items())],
+            "gauges": [{"name": n, "labels": dict(l), "value": v} for (n, l), v in sorted(_gauges.items())],
+            "histograms": [
+                {"name": n, "labels": dict(l), "buckets": list(h["buckets"]), "counts": list(h["counts"]), "sum": h["sum"], "count": h["count"]}
+                for (n, l), h in sorted(_histograms.items())
+            ],
+        }
+
+def _format_labels(labels, extra=None):
+    items = list(labels.items()) + (list(extra.items()) if extra else [])
+    if not items:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"') for _, v in items)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(items, escaped)) + "}"
+
+def prometheus_text(snap=None):
+    snap = snap or snapshot()
+    lines = []
+    typed = set()
+
+    def _header(name, kind):
+        if name in typed:
+            return
+        typed.add(name)
+        if name in _help:
+            lines.append(f"# HELP {name} {_help[name]}")
+        lines.append(f"# TYPE {name} {kind}")
+
+    for c in snap["counters"]:
+        _header(c["name"], "counter")
+        lines.append(f"{c['name']}{_format_labels(c['labels'])} {c['value']}")
+    for g in snap["gauges"]:
+        _header(g["name"], "gauge")
+        lines.append(f"{g['name']}{_format_labels(g['labels'])} {g['value']}")
+    for h in snap["histograms"]:
+        _header(h["name"], "histogram")
+        cumulative = 0
+        for bound, count in zip(h["buckets"] + ["+Inf"], h["counts"]):
+            cumulative += count
+            lines.append(f"{h['name']}_bucket{_format_labels(h['labels'], {'le': bound})} {cumulative}")
+        lines.append(f"{h['name']}_sum{_format_labels(h['labels'])} {h['sum']}")
+        lines.append(f"{h['name']}_count{_format_labels(h['labels'])} {h['count']}")
+    return "\n".join(lines) + "\n"
+
+def _write_atomic(path, text):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+def write_files(role, directory=METRICS_DIR):
+    os.makedirs(directory, exist_ok=True)
+    snap = snapshot()
+    _write_atomic(os.path.join(directory, f"{role}.json"), json.dumps(snap))
+    _write_atomic(os.path.join(directory, f"{role}.prom"), prometheus_text(snap))
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.startswith("/metrics.json"):
+            body = json.dumps(snapshot()).encode()
+            content_type = "application/json"
+        elif self.path.startswith("/metrics"):
+            body = prometheus_text().encode()
+            content_type = "text/plain; version=0.0.4"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_exporter(role, interval=10.0, port=None, directory=METRICS_DIR):
+    """Write this process's metrics every `interval` seconds and, if `port` is set, serve them over HTTP."""
+    def _loop():
+        while True:
+            time.sleep(interval)
+            try:
+                write_files(role, directory)
+            except Exception as e:
+                print(f"Failed to write metrics: {type(e).__name__}: {e}")
+
+    threading.Thread(target=_loop, name=f"metrics-{role}", daemon=True).start()
+
+    if port:
+        try:
+            server = ThreadingHTTPServer(("0.0.0.0", port), _MetricsHandler)
+        except OSError as e:
+            print(f"Metrics endpoint for {role} not started on port {port}: {e}")
+            return
+        threading.Thread(target=server.serve_forever, name=f"metrics-http-{role}", daemon=True).start()
+        print(f"Serving {role} metrics on http://0.0.0.0:{port}/metrics")
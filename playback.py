@@ -0,0 +1,214 @@
+import collections
+import os
+import time
+
+import numpy as np
+
+# Player-side clip handling: file naming, pacing and the pre-rendered and
+# decoder-ring frame sources. Only numpy is needed here, so the player process
+# starts without loading OpenCV or yt-dlp (see main.py).
+
+def video_id_from_path(video_file):
+    """Recover the YouTube video ID from a file named by our `%(id)s.<ext>` template."""
+    return os.path.basename(video_file).split(".", 1)[0]
+
+# Pre-rendered clips: one .npy file holding a record per frame with its
+# presentation timestamp and the final RGB pixels, ready to memory-map.
+PRERENDERED_SUFFIX = ".frames.npy"
+
+def prerendered_dtype(resolution=(96, 48)):
+    return np.dtype([("pts_ms", "<f8"), ("rgb", np.uint8, (resolution[1], resolution[0], 3))])
+
+# Progressive playback: the finder can queue a download that is still in
+# progress (yt-dlp's `<name>.part` file) and the player decodes it as it grows.
+STREAM_SUFFIX = ".part"
+# Give up on a stream that hasn't grown for this long.
+STREAM_STALL_SECONDS = float(os.getenv("STREAM_STALL_SECONDS", "15"))
+
+def is_streaming(video_file):
+    return video_file.endswith(STREAM_SUFFIX)
+
+def is_prerendered(path):
+    return bool(path) and path.endswith(PRERENDERED_SUFFIX)
+
+class FrameStats:
+    """
+    Optional per-stage timings collected by the frame iterators when passed as `stats`.
+
+    `stage_cpu` holds CPU seconds per stage (thread time, so sleeps don't count);
+    `pacing_error_ms` holds, per frame, how late it was yielded versus its target.
+    `dropped_frames` counts frames skipped to catch up, `late_frames` frames shown
+    more than LATE_FRAME_SECONDS after their deadline, `rebuffers` source stalls.
+    """
+    def __init__(self):
+        self.stage_cpu = collections.Counter()
+        self.pacing_error_ms = []
+        self.dropped_frames = 0
+        self.late_frames = 0
+        self.rebuffers = 0
+
+    def add(self, stage, seconds):
+        self.stage_cpu[stage] += seconds
+
+# Real-time playback policy: a frame that is more than FRAME_DROP_LATENESS
+# seconds behind its deadline is skipped instead of shown, so slow hardware
+# drops frames rather than drifting into slow motion. At most
+# MAX_CONSECUTIVE_DROPS frames are dropped in a row so the panel still updates.
+FRAME_DROP_LATENESS = float(os.getenv("FRAME_DROP_LATENESS_MS", "50")) / 1000.0
+MAX_CONSECUTIVE_DROPS = 10
+# A frame this far behind means the source stalled rather than we fell behind;
+# the clock is moved forward instead of dropping frames.
+REANCHOR_LATENESS = 0.5
+# A frame shown this much later than its deadline counts as late.
+LATE_FRAME_SECONDS = 0.02
+# time.sleep() can overshoot by a scheduler tick; sleep until this close to the
+# deadline and spin for the rest.
+SPIN_MARGIN_SECONDS = 0.001
+
+def _sleep_until(deadline):
+    while True:
+        remaining = deadline - time.perf_counter()
+        if remaining <= 0:
+            return
+        if remaining > SPIN_MARGIN_SECONDS:
+            time.sleep(remaining - SPIN_MARGIN_SECONDS)
+
+class _PlaybackClock:
+    """
+    Maps frame timestamps to wall-clock deadlines and decides which late frames to drop.
+
+    Prefers the video's own timestamps (better for variable-FPS content); falls
+    back to `fps` when a frame has none. "Video time 0" is anchored to the wall
+    clock at the first timestamped frame.
+    """
+    def __init__(self, fps, stats=None, drop_lateness=FRAME_DROP_LATENESS):
+        self.fps = fps
+        self.stats = stats
+        self.drop_lateness = drop_lateness
+        self.start_wall = time.perf_counter()
+        self.base_pos_ms = None
+        self.last_pos_ms = None
+        self.frame_index = 0
+        self.consecutive_drops = 0
+        self.deadline = self.start_wall
+
+    def should_drop(self, pos_ms):
+        """Compute this frame's deadline; True if it is too late to be worth showing."""
+        now = time.perf_counter()
+        if pos_ms is not None:
+            if self.base_pos_ms is None:
+                self.base_pos_ms = pos_ms
+                self.start_wall = now
+            self.deadline = self.start_wall + ((pos_ms - self.base_pos_ms) / 1000.0)
+            self.last_pos_ms = pos_ms
+        elif self.last_pos_ms is not None:
+            # No timestamp after timestamped frames: one frame after the last one.
+            self.last_pos_ms += 1000.0 / self.fps
+            self.deadline = self.start_wall + ((self.last_pos_ms - self.base_pos_ms) / 1000.0)
+        else:
+            self.deadline = self.start_wall + (self.frame_index / self.fps)
+        self.frame_index += 1
+
+        lateness = now - self.deadline
+        if lateness > REANCHOR_LATENESS:
+            # The source stalled (e.g. a stream waiting on the network): resume
+            # from here instead of dropping everything that was delayed.
+            self.start_wall += lateness
+            self.deadline += lateness
+            if self.stats is not None:
+                self.stats.rebuffers += 1
+            self.consecutive_drops = 0
+            return False
+        if lateness > self.drop_lateness and self.consecutive_drops < MAX_CONSECUTIVE_DROPS:
+            self.consecutive_drops += 1
+            if self.stats is not None:
+                self.stats.dropped_frames += 1
+            return True
+        self.consecutive_drops = 0
+        return False
+
+    def wait(self):
+        """Wait for the current frame's deadline."""
+        _sleep_until(self.deadline)
+        error = time.perf_counter() - self.deadline
+        if self.stats is not None:
+            self.stats.pacing_error_ms.append(error * 1000.0)
+            if error > LATE_FRAME_SECONDS:
+                self.stats.late_frames += 1
+
+def prerendered_seconds(clip_file):
+    """Displayed duration of a pre-rendered clip, from its timestamp table."""
+    clip = np.load(clip_file, mmap_mode="r")
+    pts_ms = clip["pts_ms"]
+    if len(pts_ms) < 2:
+        return 0.0
+    # Count the last frame as lasting one average frame interval.
+    span = float(pts_ms[-1] - pts_ms[0])
+    return (span + span / (len(pts_ms) - 1)) / 1000.0
+
+def iter_prerendered_frames(clip_file, max_seconds=30, stats=None):
+    """
+    Stream frames from a pre-rendered clip, paced by its timestamp table.
+
+    Frames are slices of a read-only memory map, so no decoding or copying happens here.
+    """
+    print(f"Starting pre-rendered streaming for: {clip_file}")
+    try:
+        clip = np.load(clip_file, mmap_mode="r")
+    except Exception as e:
+        print(f"ERROR: Failed to open pre-rendered clip {clip_file}: {type(e).__name__}: {e}")
+        return
+
+    pts_ms = clip["pts_ms"]
+    rgb = clip["rgb"]
+    frame_index = 0
+    clock = _PlaybackClock(30.0, stats=stats)
+    for i in range(len(clip)):
+        if clock.should_drop(float(pts_ms[i])):
+            continue
+        if (time.perf_counter() - clock.start_wall) >= max_seconds:
+            break
+        clock.wait()
+        frame_index += 1
+        yield rgb[i]
+
+    print(f"Finished streaming {frame_index} frames from {clip_file}")
+    del pts_ms, rgb, clip
+
+def iter_ring_frames(ring, clip_id, max_seconds=30, stats=None, timeout=None):
+    """
+    Stream frames of `clip_id` from a FrameRing filled by a decoder process, paced by their timestamps.
+
+    Frames are views into shared memory and stay valid until the next one is
+    requested. Slots left over from an earlier, abandoned clip are skipped. When
+    we stop (end of clip, `max_seconds`, or the consumer closing us) the clip is
+    cancelled so the decoder moves on.
+    """
+    timeout = STREAM_STALL_SECONDS + 5 if timeout is None else timeout
+    frame_index = 0
+    clock = _PlaybackClock(30.0, stats=stats)
+    try:
+        while True:
+            item = ring.peek(timeout=timeout)
+            if item is None:
+                print(f"Decoder produced nothing for {timeout:.0f}s, ending clip {clip_id}")
+                break
+            slot_clip, pts_ms, is_end, frame = item
+            if slot_clip != clip_id:
+                ring.advance()
+                continue
+            if is_end:
+                ring.advance()
+                break
+            if clock.should_drop(pts_ms):
+                ring.advance()
+                continue
+            if (time.perf_counter() - clock.start_wall) >= max_seconds:
+                break
+            clock.wait()
+            frame_index += 1
+            yield frame
+            ring.advance()
+    finally:
+        ring.cancel(clip_id)
+    print(f"Finished streaming {frame_index} frames of clip {clip_id} from the decoder")
@@ -0,0 +1,148 @@
+import json
+import os
+import random
+import threading
+import time
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+QUERY_STATS_PATH = os.getenv("YT_QUERY_STATS", os.path.join(BASE_DIR, "query_stats.json"))
+
+SEED_WORDS = [
+    "test", "demo", "vlog", "video", "clip", "first", "my", "day", "new", "update",
+    "img", "dsc", "camera", "phone", "setup", "build", "repair", "art", "music", "cover", "song",
+    "life", "travel", "dog", "cat", "challenge", "fun", "music", "workout", "fitness",
+    "food", "recipe", "nature", "art", "movie", "review", "unboxing", "science", "technology",
+    "learn", "how", "guide", "explore", "trick", "tips", "experiment", "animal", "car", "road",
+    "short", "trend", "random", "kids", "play", "let's", "game", "dance", "cute", "best", "hello",
+]
+
+# Random suffix token styles appended to every query.
+TOKEN_STYLES = ("digits", "letters")
+
+def _empty_stats():
+    return {"queries": 0, "entries": 0, "passed": 0, "accepted": 0, "successes": 0, "ttfa_sum": 0.0}
+
+class QueryPlanner:
+    """
+    Picks search queries, biased toward seed words and token styles that have produced accepted videos.
+
+    Each word and token style is an arm of a Thompson-sampling bandit: a query
+    "succeeds" if it yields at least one accepted video. With probability
+    `explore` a query is drawn uniformly instead, so arms that had a bad run get
+    retried. Per-arm counts (queries, entries returned, entries passing the
+    prefilter, accepted videos, time to first acceptance) persist across restarts.
+    """
+    def __init__(self, seed_words=SEED_WORDS, path=QUERY_STATS_PATH, explore=0.1, save_every=10):
+        self.seed_words = sorted(set(seed_words))
+        self.path = path
+        self.explore = explore
+        self.save_every = save_every
+
+        self._lock = threading.Lock()
+        self.words = {w: _empty_stats() for w in self.seed_words}
+        self.styles = {s: _empty_stats() for s in TOKEN_STYLES}
+        self.total_queries = 0
+        self.total_accepted = 0
+        # query -> {"words": (w1, w2), "style": style, "started": t, "accepted": n}
+        self._active = {}
+        self._unsaved = 0
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            print(f"Ignoring unreadable query stats {self.path}: {type(e).__name__}: {e}")
+            return
+        for w, stats in (data.get("words") or {}).items():
+            if w in self.words:
+                self.words[w].update(stats)
+        for s, stats in (data.get("styles") or {}).items():
+            if s in self.styles:
+                self.styles[s].update(stats)
+        self.total_queries = data.get("total_queries", 0)
+        self.total_accepted = data.get("total_accepted", 0)
+        print(f"Loaded query stats for {len(self.words)} words from {self.path}")
+
+    def save(self):
+        with self._lock:
+            data = {
+                "words": self.words,
+                "styles": self.styles,
+                "total_queries": self.total_queries,
+                "total_accepted": self.total_accepted,
+            }
+            tmp_path = f"{self.path}.tmp"
+            try:
+                with open(tmp_path, "w") as f:
+                    json.dump(data, f)
+                os.replace(tmp_path, self.path)
+                self._unsaved = 0
+            except Exception as e:
+                print(f"Failed to save query stats: {type(e).__name__}: {e}")
+
+    @staticmethod
+    def _sample(stats):
+        return random.betavariate(1 + stats["successes"], 1 + max(0, stats["queries"] - stats["successes"]))
+
+    def _pick(self, arms, exclude=()):
+        names = [name for name in arms if name not in exclude]
+        if random.random() < self.explore:
+            return random.choice(names)
+        return max(names, key=lambda name: self._sample(arms[name]))
+
+    def next_query(self):
+        with self._lock:
+            w1 = self._pick(self.words)
+            w2 = self._pick(self.words, exclude=(w1,))
+            style = self._pick(self.styles)
+        if style == "digits":
+            token = str(random.randint(0, 9999)).zfill(4)
+        else:
+            token = "".join(random.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(random.randint(3, 5)))
+        query = f"{w1} {w2} {token}"
+        with self._lock:
+            self._active[query] = {"words": (w1, w2), "style": style, "started": time.monotonic(), "accepted": 0}
+            # Outcomes for very old queries will never arrive; don't let them pile up.
+            if len(self._active) > 200:
+                cutoff = time.monotonic() - 3600
+                self._active = {q: a for q, a in self._active.items() if a["started"] >= cutoff}
+        return query
+
+    def _arms(self, active):
+        return [self.words[w] for w in active["words"]] + [self.styles[active["style"]]]
+
+    def record_search(self, query, entries_returned, entries_passed):
+        with self._lock:
+            active = self._active.get(query)
+            if active is None:
+                return
+            self.total_queries += 1
+            for stats in self._arms(active):
+                stats["queries"] += 1
+                stats["entries"] += entries_returned
+                stats["passed"] += entries_passed
+            self._unsaved += 1
+            should_save = self._unsaved >= self.save_every
+        if should_save:
+            self.save()
+
+    def record_accept(self, query):
+        with self._lock:
+            active = self._active.get(query)
+            if active is None:
+                return
+            self.total_accepted += 1
+            first = active["accepted"] == 0
+            active["accepted"] += 1
+            elapsed = time.monotonic() - active["started"]
+            for stats in self._arms(active):
+                stats["accepted"] += 1
+                if first:
+                    stats["successes"] += 1
+                    stats["ttfa_sum"] += elapsed
+            ratio = self.total_queries / self.total_accepted
+        print(f"Query '{query}' accepted a video ({ratio:.2f} searches per accepted video overall)")
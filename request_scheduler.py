@@ -0,0 +1,251 @@
+import collections
+import contextlib
+import threading
+import time
+
+from yt_dlp.utils import DownloadError, ExtractorError
+
+import metrics
+
+# How a yt-dlp call failed, which decides what happens next.
+SUCCESS = "success"
+# YouTube wants us to slow down (HTTP 429, bot checks): back off globally.
+THROTTLED = "throttled"
+# Network hiccups, 5xx, timeouts: worth retrying the same request later.
+TRANSIENT = "transient"
+# The video itself is unavailable, private, removed...: never retry it.
+PERMANENT = "permanent"
+
+# Matched against error messages; yt-dlp reports HTTP 429 as "HTTP Error 429: Too Many Requests".
+_THROTTLE_MARKERS = (
+    "too many requests", "rate-limit", "rate limit", "ratelimit",
+    "not a bot", "confirm you're not a robot", "confirm you are not a robot", "unusual traffic",
+)
+
+def classify_error(exc):
+    """THROTTLED, TRANSIENT or PERMANENT for an exception raised by a yt-dlp call."""
+    # DownloadError wraps the original exception; look at the whole chain.
+    chain = []
+    seen = set()
+    while exc is not None and id(exc) not in seen:
+        seen.add(id(exc))
+        chain.append(exc)
+        if isinstance(exc, DownloadError) and exc.exc_info and exc.exc_info[1] is not None:
+            exc = exc.exc_info[1]
+        else:
+            exc = getattr(exc, "cause", None) or exc.__cause__ or exc.__context__
+
+    for e in chain:
+        status = getattr(e, "status", None) or getattr(e, "code", None)
+        if status == 429:
+            return THROTTLED
+        text = str(e).lower()
+        if any(marker in text for marker in _THROTTLE_MARKERS):
+            return THROTTLED
+    for e in chain:
+        if isinstance(e, ExtractorError) and e.expected:
+            return PERMANENT
+    return TRANSIENT
+
+class TokenBucket:
+    """
+    `rate` requests per second with up to `burst` banked, safe to share between threads.
+
+    Callers reserve a token and sleep for their turn outside the lock, so
+    waiters are served in order. The rate can be changed at any time.
+    """
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def take(self):
+        """Wait for a token; returns the seconds waited."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+_STATE_GAUGE = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+class CircuitBreaker:
+    """
+    Stops all requests for a while once YouTube starts throttling us.
+
+    Opens after `threshold` throttled calls within `window_seconds`. After the
+    cooldown one probe call is let through (half-open): if it isn't throttled
+    the breaker closes and the next cooldown halves, otherwise it reopens with
+    the cooldown doubled, up to `max_cooldown_seconds`.
+    """
+    def __init__(self, threshold=3, window_seconds=60, base_cooldown_seconds=30, max_cooldown_seconds=1800):
+        self.threshold = threshold
+        self.window_seconds = window_seconds
+        self.base_cooldown_seconds = base_cooldown_seconds
+        self.max_cooldown_seconds = max_cooldown_seconds
+
+        self.state = CLOSED
+        self.cooldown_seconds = base_cooldown_seconds
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self._throttles = collections.deque()
+        self._probing = False
+        self._cond = threading.Condition()
+        metrics.set_gauge("finder_circuit_state", _STATE_GAUGE[CLOSED])
+
+    def _set_state(self, state):
+        self.state = state
+        metrics.set_gauge("finder_circuit_state", _STATE_GAUGE[state])
+
+    def _open(self, now):
+        self._set_state(OPEN)
+        self.opened_at = now
+        self.times_opened += 1
+        self._throttles.clear()
+        metrics.inc("finder_circuit_opened_total")
+        print(f"Throttled by YouTube, pausing all requests for {self.cooldown_seconds:.0f}s")
+
+    def before_call(self):
+        """Wait until a call may go out. Returns (seconds waited, whether this call is the half-open probe)."""
+        started = time.monotonic()
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                if self.state == CLOSED:
+                    return time.monotonic() - started, False
+                if self.state == OPEN:
+                    remaining = self.opened_at + self.cooldown_seconds - now
+                    if remaining > 0:
+                        self._cond.wait(timeout=remaining)
+                        continue
+                    self._set_state(HALF_OPEN)
+                    print("Cooldown over, probing with a single request")
+                if not self._probing:
+                    self._probing = True
+                    return time.monotonic() - started, True
+                self._cond.wait(timeout=1.0)
+
+    def record(self, outcome, probe=False):
+        """Record how a call went; `probe` is what `before_call` returned for it."""
+        with self._cond:
+            now = time.monotonic()
+            if probe:
+                self._probing = False
+                if outcome == THROTTLED:
+                    self.cooldown_seconds = min(self.max_cooldown_seconds, self.cooldown_seconds * 2)
+                    self._open(now)
+                else:
+                    self.cooldown_seconds = max(self.base_cooldown_seconds, self.cooldown_seconds / 2)
+                    self._set_state(CLOSED)
+                    print("Probe request went through, resuming requests")
+            elif outcome == THROTTLED and self.state == CLOSED:
+                self._throttles.append(now)
+                while self._throttles and now - self._throttles[0] > self.window_seconds:
+                    self._throttles.popleft()
+                if len(self._throttles) >= self.threshold:
+                    self._open(now)
+            self._cond.notify_all()
+
+class RequestScheduler:
+    """
+    Gate for every yt-dlp network call: a token bucket per call kind plus one shared circuit breaker.
+
+    Use as `with scheduler.call("search"): ...`. Failures are classified (see
+    `classify_error`) when they leave the block. Rates adapt: a throttled call
+    halves every bucket's rate (down to `min_rate_fraction` of its configured
+    rate) and each run of `recover_after` calls of a kind without throttling
+    adds back a tenth of its configured rate. That trades bursts for steady
+    throughput, so throttling periods are short instead of draining the queue.
+
+    `rates` maps kind -> requests per second; a kind with a rate of 0 or less
+    gets no bucket, and None disables them all (the breaker still applies).
+    """
+    def __init__(self, rates=None, burst=2, breaker=None, min_rate_fraction=0.1, recover_after=20):
+        self.configured_rates = {kind: rate for kind, rate in (rates or {}).items() if rate > 0}
+        self.burst = burst
+        self.breaker = breaker or CircuitBreaker()
+        self.min_rate_fraction = min_rate_fraction
+        self.recover_after = recover_after
+
+        self._lock = threading.Lock()
+        self._buckets = {kind: TokenBucket(rate, burst) for kind, rate in self.configured_rates.items()}
+        self._clean_streak = collections.Counter()
+        self.outcomes = collections.Counter()
+        self.waited_seconds = collections.Counter()
+        for kind, rate in self.configured_rates.items():
+            metrics.set_gauge("finder_request_rate", rate, kind=kind)
+
+    @contextlib.contextmanager
+    def call(self, kind):
+        waited, probe = self.breaker.before_call()
+        try:
+            bucket = self._buckets.get(kind)
+            if bucket is not None:
+                waited += bucket.take()
+            if waited > 0:
+                metrics.observe("finder_request_wait_seconds", waited, kind=kind)
+            with self._lock:
+                self.waited_seconds[kind] += waited
+        except BaseException:
+            # Don't leave a half-open breaker waiting on a probe that never went out.
+            self.breaker.record(SUCCESS, probe)
+            raise
+        try:
+            yield
+        except Exception as e:
+            self._record(kind, classify_error(e), probe)
+            raise
+        except BaseException:
+            self._record(kind, SUCCESS, probe)
+            raise
+        else:
+            self._record(kind, SUCCESS, probe)
+
+    def _record(self, kind, outcome, probe=False):
+        metrics.inc("finder_requests_total", kind=kind, outcome=outcome)
+        with self._lock:
+            self.outcomes[(kind, outcome)] += 1
+            if outcome == THROTTLED:
+                self._clean_streak.clear()
+                for other, bucket in self._buckets.items():
+                    self._set_rate(other, bucket, bucket.rate / 2)
+            elif kind in self._buckets:
+                self._clean_streak[kind] += 1
+                if self._clean_streak[kind] >= self.recover_after:
+                    self._clean_streak[kind] = 0
+                    bucket = self._buckets[kind]
+                    self._set_rate(kind, bucket, bucket.rate + self.configured_rates[kind] / 10)
+        self.breaker.record(outcome, probe)
+
+    def _set_rate(self, kind, bucket, rate):
+        configured = self.configured_rates[kind]
+        rate = min(configured, max(configured * self.min_rate_fraction, rate))
+        if rate == bucket.rate:
+            return
+        bucket.rate = rate
+        metrics.set_gauge("finder_request_rate", rate, kind=kind)
+        metrics.debug(f"{kind} requests now limited to {rate:.2f}/s")
+
+    def stats(self):
+        """Breaker state, current rates and outcome counts, for logs and benchmarks."""
+        with self._lock:
+            outcomes = {}
+            for (kind, outcome), count in self.outcomes.items():
+                outcomes.setdefault(kind, {})[outcome] = count
+            return {
+                "circuit": self.breaker.state,
+                "cooldown_seconds": self.breaker.cooldown_seconds,
+                "times_opened": self.breaker.times_opened,
+                "rates": {kind: round(bucket.rate, 3) for kind, bucket in self._buckets.items()},
+                "outcomes": outcomes,
+                "waited_seconds": {kind: round(seconds, 2) for kind, seconds in self.waited_seconds.items()},
+            }
@@ -0,0 +1,147 @@
+import collections
+import os
+import sqlite3
+import threading
+import time
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SEEN_INDEX_PATH = os.getenv("YT_SEEN_INDEX", os.path.join(BASE_DIR, "seen_index.sqlite3"))
+
+class SeenIndex:
+    """
+    Persistent index of video IDs we've already vetted ("seen") or shown ("played").
+
+    Lookups hit an in-memory ordered dict (O(1), no I/O). Writes are buffered and
+    flushed to SQLite in batches, so the filtering loop never waits on disk.
+    Entries are evicted by least-recent use once there are more than `max_entries`,
+    and by age once they haven't been touched for `max_age_days` (a video we saw
+    that long ago can no longer pass the upload-date filter anyway).
+
+    The finder and the player each open their own instance on the same file, so
+    an eviction only deletes the row if no other instance has touched it since.
+    """
+    def __init__(self, path=SEEN_INDEX_PATH, max_entries=20000, max_age_days=7, flush_every=50, flush_interval=5.0):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age_seconds = max_age_days * 86400
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        # vid -> (state, last_used)
+        self._entries = collections.OrderedDict()
+        self._dirty = {}
+        # vid -> last_used of the evicted entry
+        self._evicted = {}
+        self._last_flush = time.monotonic()
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS seen ("
+            " vid TEXT PRIMARY KEY,"
+            " state TEXT NOT NULL,"
+            " last_used REAL NOT NULL)"
+        )
+        self._db.commit()
+        self._load()
+
+    def _load(self):
+        cutoff = time.time() - self.max_age_seconds
+        with self._db:
+            self._db.execute("DELETE FROM seen WHERE last_used < ?", (cutoff,))
+        rows = self._db.execute(
+            "SELECT vid, state, last_used FROM seen ORDER BY last_used DESC LIMIT ?", (self.max_entries,)
+        ).fetchall()
+        for vid, state, last_used in reversed(rows):
+            self._entries[vid] = (state, last_used)
+        print(f"Loaded {len(self._entries)} seen video IDs from {self.path}")
+
+    def __contains__(self, vid):
+        with self._lock:
+            entry = self._entries.get(vid)
+            if entry is None:
+                return False
+            now = time.time()
+            if now - entry[1] > self.max_age_seconds:
+                del self._entries[vid]
+                self._dirty.pop(vid, None)
+                self._evicted[vid] = entry[1]
+                return False
+            touched = (entry[0], now)
+            self._entries[vid] = touched
+            self._entries.move_to_end(vid)
+            self._dirty[vid] = touched
+            return True
+
+    def __len__(self):
+        return len(self._entries)
+
+    def add(self, vid, state="seen"):
+        if not vid:
+            return
+        now = time.time()
+        with self._lock:
+            previous = self._entries.pop(vid, None)
+            # Never downgrade a played video back to merely seen.
+            if previous is not None and previous[0] == "played":
+                state = "played"
+            self._entries[vid] = (state, now)
+            self._dirty[vid] = (state, now)
+            self._evicted.pop(vid, None)
+            while len(self._entries) > self.max_entries:
+                old_vid, (_, old_last_used) = self._entries.popitem(last=False)
+                self._dirty.pop(old_vid, None)
+                self._evicted[old_vid] = old_last_used
+            should_flush = (
+                len(self._dirty) >= self.flush_every
+                or (time.monotonic() - self._last_flush) >= self.flush_interval
+            )
+        if should_flush:
+            self.flush()
+
+    def mark_played(self, vid):
+        self.add(vid, state="played")
+        self.flush()
+
+    def flush(self):
+        with self._lock:
+            dirty = self._dirty
+            evicted = self._evicted
+            self._dirty = {}
+            self._evicted = {}
+            self._last_flush = time.monotonic()
+        if not dirty and not evicted:
+            return
+        # Write outside the lookup lock so lookups never wait on disk.
+        with self._db_lock:
+            try:
+                cutoff = time.time() - self.max_age_seconds
+                with self._db:
+                    self._db.executemany(
+                        "INSERT INTO seen (vid, state, last_used) VALUES (?, ?, ?)"
+                        " ON CONFLICT(vid) DO UPDATE SET"
+                        " state = CASE WHEN seen.state = 'played' THEN 'played' ELSE excluded.state END,"
+                        " last_used = excluded.last_used",
+                        [(vid, state, last_used) for vid, (state, last_used) in dirty.items()],
+                    )
+                    # Keep rows another instance refreshed after we loaded them.
+                    self._db.executemany(
+                        "DELETE FROM seen WHERE vid = ? AND last_used <= ?", list(evicted.items())
+                    )
+                    self._db.execute("DELETE FROM seen WHERE last_used < ?", (cutoff,))
+            except Exception as e:
+                print(f"Failed to flush seen index: {type(e).__name__}: {e}")
+
+    def close(self):
+        self.flush()
+        try:
+            with self._db_lock:
+                self._db.close()
+        except Exception:
+            pass
@@ -0,0 +1,37 @@
+import numpy as np
+
+from frame_codec import DELTA, KEYFRAME, DeltaDecoder, DeltaEncoder
+
+SHAPE = (48, 96, 3)
+
+def test_delta_round_trip_with_random_row_changes():
+    rng = np.random.default_rng(1)
+    encoder = DeltaEncoder(SHAPE, keyframe_interval=1000)
+    decoder = DeltaDecoder(SHAPE)
+    frame = rng.integers(0, 256, SHAPE, dtype=np.uint8)
+    for i in range(50):
+        if i:
+            rows = rng.choice(SHAPE[0], size=rng.integers(0, 6), replace=False)
+            frame[rows] = rng.integers(0, 256, (len(rows),) + SHAPE[1:], dtype=np.uint8)
+        packet = encoder.encode(frame)
+        assert packet[0] == (KEYFRAME if i == 0 else DELTA)
+        np.testing.assert_array_equal(decoder.decode(packet), frame)
+    assert encoder.keyframes == 1
+    assert encoder.deltas == 49
+
+def test_keyframe_forced_every_interval():
+    encoder = DeltaEncoder(SHAPE, keyframe_interval=3)
+    frame = np.zeros(SHAPE, dtype=np.uint8)
+    kinds = [encoder.encode(frame)[0] for _ in range(8)]
+    assert kinds == [KEYFRAME, DELTA, DELTA, DELTA, KEYFRAME, DELTA, DELTA, DELTA]
+
+def test_keyframe_when_delta_would_not_be_smaller():
+    encoder = DeltaEncoder(SHAPE, keyframe_interval=1000)
+    decoder = DeltaDecoder(SHAPE)
+    decoder.decode(encoder.encode(np.zeros(SHAPE, dtype=np.uint8)))
+    # Every row changed: a delta would be the full frame plus a bitmap.
+    frame = np.full(SHAPE, 7, dtype=np.uint8)
+    packet = encoder.encode(frame)
+    assert packet[0] == KEYFRAME
+    assert len(packet) == 1 + frame.size
+    np.testing.assert_array_equal(decoder.decode(packet), frame)
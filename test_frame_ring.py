@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+from frame_ring import FrameRing
+
+def _frame(value):
+    return np.full((48, 96, 3), value, dtype=np.uint8)
+
+def test_frames_pass_through_ring_in_order():
+    writer = FrameRing(slots=4)
+    reader = FrameRing(name=writer.name)
+    try:
+        for i in range(3):
+            assert writer.put(1, i * 40.0, _frame(i))
+        assert writer.end_clip(1)
+        seen = []
+        for _ in range(4):
+            clip_id, pts_ms, is_end, frame = reader.peek(timeout=1)
+            seen.append((clip_id, pts_ms, is_end, int(frame[0, 0, 0])))
+            reader.advance()
+        assert seen == [(1, 0.0, False, 0), (1, 40.0, False, 1), (1, 80.0, False, 2), (1, 0.0, True, 0)]
+        assert reader.peek(timeout=0.01) is None
+    finally:
+        reader.close()
+        writer.close()
+
+def test_slot_count_comes_from_the_ring():
+    writer = FrameRing(slots=8)
+    reader = FrameRing(name=writer.name, slots=2)
+    try:
+        assert reader.slots == 8
+    finally:
+        reader.close()
+        writer.close()
+
+def test_full_ring_times_out_and_cancel_stops_writer():
+    writer = FrameRing(slots=2)
+    reader = FrameRing(name=writer.name)
+    try:
+        assert writer.put(1, 0.0, _frame(1))
+        assert writer.put(1, 40.0, _frame(2))
+        assert not writer.put(1, 80.0, _frame(3), timeout=0.05)
+        reader.cancel(1)
+        # A cancelled clip is refused without waiting; a newer one still fits once there is room.
+        assert not writer.put(1, 80.0, _frame(3))
+        assert not writer.end_clip(1)
+        reader.advance()
+        assert writer.put(2, 0.0, _frame(4), timeout=1)
+    finally:
+        reader.close()
+        writer.close()
+
+def test_owner_close_unlinks_shared_memory():
+    writer = FrameRing(slots=2)
+    name = writer.name
+    writer.close()
+    with pytest.raises(FileNotFoundError):
+        FrameRing(name=name)
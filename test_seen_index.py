@@ -0,0 +1,42 @@
+import time
+
+from seen_index import SeenIndex
+
+def test_eviction_keeps_rows_another_instance_refreshed(tmp_path):
+    path = str(tmp_path / "seen.sqlite3")
+    finder = SeenIndex(path, max_entries=2)
+    finder.add("old")
+    finder.add("refreshed")
+    finder.flush()
+
+    # The player loads its snapshot, then the finder touches one of the IDs.
+    player = SeenIndex(path, max_entries=2)
+    time.sleep(0.01)
+    assert "refreshed" in finder
+    finder.flush()
+
+    # The player's LRU evicts both IDs from its stale snapshot.
+    player.add("played-1", state="played")
+    player.mark_played("played-2")
+
+    reloaded = SeenIndex(path, max_entries=10)
+    assert "refreshed" in reloaded
+    assert "old" not in reloaded
+    assert "played-2" in reloaded
+
+def test_lookup_expires_entries_by_age(tmp_path):
+    index = SeenIndex(str(tmp_path / "seen.sqlite3"), max_age_days=1)
+    index.add("fresh")
+    index.add("stale")
+    index._entries["stale"] = ("seen", time.time() - 2 * 86400)
+    assert "fresh" in index
+    assert "stale" not in index
+    assert "stale" not in index._entries
+
+def test_played_is_never_downgraded(tmp_path):
+    path = str(tmp_path / "seen.sqlite3")
+    index = SeenIndex(path)
+    index.mark_played("vid")
+    index.add("vid")
+    index.close()
+    assert SeenIndex(path)._entries["vid"][0] == "played"
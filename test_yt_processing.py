@@ -0,0 +1,46 @@
+import io
+import os
+
+from playback import STREAM_SUFFIX, _PlaybackClock
+from yt_processing import _SHOWINFO_PTS, _follow_growing_file
+
+def test_follow_growing_file_copies_renamed_download(tmp_path):
+    # The download finished (and .part was renamed away) before the reader opened it.
+    final_file = tmp_path / "abc.mp4"
+    final_file.write_bytes(b"x" * 200_000)
+    out = io.BytesIO()
+    _follow_growing_file(str(final_file) + STREAM_SUFFIX, out, stall_seconds=1)
+    assert out.getvalue() == b"x" * 200_000
+
+def test_follow_growing_file_reads_part_until_renamed(tmp_path):
+    part_file = tmp_path / ("abc.mp4" + STREAM_SUFFIX)
+    part_file.write_bytes(b"y" * 1000)
+
+    class _RenameOnFirstWrite(io.BytesIO):
+        def write(self, data):
+            if os.path.exists(part_file):
+                with open(part_file, "ab") as f:
+                    f.write(b"z" * 10)
+                os.replace(part_file, tmp_path / "abc.mp4")
+            return super().write(data)
+
+    out = _RenameOnFirstWrite()
+    _follow_growing_file(str(part_file), out, stall_seconds=1)
+    assert out.getvalue() == b"y" * 1000 + b"z" * 10
+
+def test_showinfo_nopts_frames_keep_their_place():
+    lines = [
+        "[Parsed_showinfo_2 @ 0x1] n:   0 pts:      0 pts_time:0       duration:512",
+        "[Parsed_showinfo_2 @ 0x1] n:   1 pts:NOPTS pts_time:NOPTS duration:512",
+        "[Parsed_showinfo_2 @ 0x1] n:   2 pts:   1024 pts_time:0.0666667 duration:512",
+    ]
+    assert [_SHOWINFO_PTS.search(line).group(1) for line in lines] == ["0", "NOPTS", "0.0666667"]
+
+def test_playback_clock_times_untimestamped_frame_after_previous():
+    clock = _PlaybackClock(fps=10)
+    clock.should_drop(100.0)
+    start = clock.deadline
+    clock.should_drop(None)
+    assert abs(clock.deadline - start - 0.1) < 1e-9
+    clock.should_drop(300.0)
+    assert abs(clock.deadline - start - 0.2) < 1e-9
@@ -0,0 +1,136 @@
+import collections
+import contextlib
+import itertools
+import threading
+import time
+
+from yt_dlp import YoutubeDL
+
+import metrics
+from request_scheduler import PERMANENT, classify_error
+
+def _is_session_error(exc):
+    """
+    True if a failure says something about the session rather than the video.
+
+    yt-dlp reports "video unavailable/private/removed" as an expected
+    ExtractorError; those don't count against the session. Network errors,
+    unexpected extractor failures (e.g. a stale player script), throttling
+    and the like do.
+    """
+    return classify_error(exc) != PERMANENT
+
+class _Session:
+    def __init__(self, options, lane, factory):
+        self.lane = lane
+        self.ydl = factory(options)
+        self.created = time.monotonic()
+        self.requests = 0
+        # True for each recent request that failed because of the session.
+        self.recent = collections.deque(maxlen=20)
+
+    def error_rate(self):
+        return sum(self.recent) / len(self.recent) if self.recent else 0.0
+
+    def close(self):
+        try:
+            self.ydl.close()
+        except Exception as e:
+            print(f"Failed to close yt-dlp session {self.lane}: {type(e).__name__}: {e}")
+
+class YdlSessionPool:
+    """
+    Long-lived YoutubeDL instances, one per worker thread ("lane").
+
+    YoutubeDL isn't thread-safe, but reusing one per thread keeps its HTTP
+    connections, cookies and extractor caches warm between requests. A lane's
+    instance is replaced the next time that thread asks for it once it is older
+    than `max_age_seconds`, or once at least `min_errors` of its last 20
+    requests failed for session reasons and that is at least `max_error_rate`
+    of them.
+
+    `factory(options)` builds each instance; it defaults to YoutubeDL and lets
+    tools substitute a stand-in (see finder_benchmark.py).
+    """
+    def __init__(self, options, max_age_seconds=3600, max_error_rate=0.5, min_errors=5, factory=YoutubeDL):
+        self.options = options
+        self.factory = factory
+        self.max_age_seconds = max_age_seconds
+        self.max_error_rate = max_error_rate
+        self.min_errors = min_errors
+
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._sessions = {}
+        self._lane_ids = itertools.count()
+        self.created = 0
+        self.recycled = collections.Counter()
+
+    def _new_session(self, lane):
+        session = _Session(self.options, lane, self.factory)
+        with self._lock:
+            self._sessions[lane] = session
+            self.created += 1
+            if self.created == 1:
+                self._report_handlers(session.ydl)
+        metrics.inc("finder_ydl_sessions_created_total")
+        return session
+
+    @staticmethod
+    def _report_handlers(ydl):
+        # Only the "Requests" handler keeps connections alive between requests.
+        try:
+            names = [rh.RH_NAME for rh in ydl._request_director.handlers.values()]
+        except Exception:
+            return
+        print(f"yt-dlp request handlers: {', '.join(names)}")
+        if "requests" not in [name.lower() for name in names]:
+            print("Install the 'requests' package so yt-dlp can reuse HTTP connections")
+
+    def _recycle_reason(self, session):
+        if time.monotonic() - session.created > self.max_age_seconds:
+            return "age"
+        errors = sum(session.recent)
+        if errors >= self.min_errors and session.error_rate() >= self.max_error_rate:
+            return "errors"
+        return None
+
+    def get(self):
+        """This thread's YoutubeDL, created or recycled as needed."""
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = self._new_session(next(self._lane_ids))
+            return session.ydl
+        reason = self._recycle_reason(session)
+        if reason is not None:
+            print(f"Recycling yt-dlp session {session.lane} ({reason}, {session.requests} requests, {session.error_rate():.0%} recent errors)")
+            with self._lock:
+                self.recycled[reason] += 1
+            metrics.inc("finder_ydl_sessions_recycled_total", reason=reason)
+            session.close()
+            session = self._local.session = self._new_session(session.lane)
+        return session.ydl
+
+    @contextlib.contextmanager
+    def session(self):
+        """Use this thread's YoutubeDL for one request, recording whether it failed for session reasons."""
+        ydl = self.get()
+        session = self._local.session
+        session.requests += 1
+        try:
+            yield ydl
+        except Exception as e:
+            session.recent.append(_is_session_error(e))
+            raise
+        else:
+            session.recent.append(False)
+
+    def stats(self):
+        with self._lock:
+            sessions = list(self._sessions.values())
+        return {
+            "lanes": len(sessions),
+            "created": self.created,
+            "recycled": dict(self.recycled),
+            "requests": sum(s.requests for s in sessions),
+        }
@@ -3,13 +3,26 @@ import datetime
 import time
 import os
 import urllib.parse
+import re
+import queue
+import shutil
+import subprocess
+import threading
+import collections
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 import cv2
-from yt_dlp import YoutubeDL
+import numpy as np
 
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-TEMP_DIR = os.path.join(BASE_DIR, "temp")
+import metrics
+from seen_index import SeenIndex
+from query_planner import QueryPlanner
+from candidate_reservoir import CandidateReservoir
+from frame_preprocess import FramePreprocessor, PANEL_LUT, apply_lut, ffmpeg_crop_scale
+from clip_store import TEMP_DIR
+from playback import _PlaybackClock, PRERENDERED_SUFFIX, STREAM_STALL_SECONDS, STREAM_SUFFIX, prerendered_dtype, is_streaming
 
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 YDL_OPTIONS = {
     'format': '18/best[ext=mp4][acodec!=none][vcodec!=none][height<=360]/best[ext=mp4][acodec!=none][vcodec!=none]/best',
     'noplaylist': True,
@@ -19,10 +32,28 @@ YDL_OPTIONS = {
     'outtmpl': os.path.join(TEMP_DIR, "%(id)s.%(ext)s"),
     'download_ranges': lambda info_dict, ydl: [{'start_time': 0, 'end_time': 30}],
     'remote_components': ['ejs:github'],
+    # Keep yt-dlp's cache (the downloaded EJS challenge solver, processed player
+    # scripts) next to the app so restarts don't fetch it again. The default,
+    # ~/.cache, is often missing or read-only under systemd.
+    'cachedir': os.getenv("YT_CACHE_DIR", os.path.join(BASE_DIR, "yt_dlp_cache")),
+    # Have the search-results extractor turn "3 days ago" into an approximate
+    # timestamp so the prefilter can reject old videos without a full extraction.
+    'extractor_args': {'youtubetab': {'approximate_date': ['']}},
 }
 
+# Format selection for matrix playback: we only ever show 96x48 pixels and never
+# play audio, so prefer the smallest video-only H.264 rendition that still has
+# enough detail to downsample well (>=144p). AV1/VP9 are avoided where possible
+# because they decode much slower on the Pi. Falls back to the muxed formats.
+MATRIX_FORMAT = (
+    'wv[height>=144][vcodec^=avc1]'
+    '/wv[height>=144][vcodec!^=av01][vcodec!^=vp9][vcodec!^=vp09]'
+    '/wv[height>=144]'
+    '/' + YDL_OPTIONS['format']
+)
+
 class Ydl:
-    def __init__(self, options):
+    def __init__(self, options, ydl_factory=None, request_scheduler=None):
         # Coarse buckets:
         # - "This week": last 7 days
         self.max_age_days = 7
@@ -49,6 +80,20 @@ class Ydl:
             opts.pop("remote_components", None)
         if os.getenv("YT_DISABLE_RANGES", "").strip() in ("1", "true", "True", "yes", "YES"):
             opts.pop("download_ranges", None)
+        # yt-dlp needs ffmpeg to cut ranges; without it the download would fail outright.
+        if "download_ranges" in opts and not shutil.which("ffmpeg"):
+            print("ffmpeg not found, downloading whole videos instead of the first 30s")
+            opts.pop("download_ranges", None)
+        # Ranged downloads are cut by ffmpeg; have it write fragmented MP4 so the
+        # player can start decoding the file while it is still being written.
+        if "download_ranges" in opts:
+            downloader_args = dict(opts.get("external_downloader_args") or {})
+            downloader_args.setdefault("ffmpeg_o", ["-movflags", "+frag_keyframe+empty_moov+default_base_moof"])
+            opts["external_downloader_args"] = downloader_args
+
+        # Smallest video-only rendition unless disabled (YT_MATRIX_FORMAT=0).
+        if os.getenv("YT_MATRIX_FORMAT", "1").strip() not in ("0", "false", "False", "no", "NO"):
+            opts["format"] = MATRIX_FORMAT
 
         # Minimal progress hook to see the *actual* output path on device.
         def _progress_hook(d):
@@ -65,12 +110,60 @@ class Ydl:
         opts["progress_hooks"] = existing_hooks + [_progress_hook]
 
         self.options = opts
-        self.ydl = YoutubeDL(self.options)
-
-        # Keep a small in-memory cache of IDs we've already attempted this run.
-        # This reduces repeated lookups from overlapping/random searches.
-        self._seen_ids = set()
-        self._seen_ids_max = 5000
+        # YoutubeDL instances aren't safe to share across threads, so each
+        # search, vetting or download thread gets its own long-lived session.
+        # `ydl_factory` swaps YoutubeDL for a stand-in (record/replay benchmarks).
+        # Imported here so processes that only decode (the player's decoder) never load yt-dlp.
+        from ydl_sessions import YdlSessionPool
+        session_args = {"factory": ydl_factory} if ydl_factory is not None else {}
+        self.sessions = YdlSessionPool(
+            self.options,
+            max_age_seconds=float(os.getenv("YT_SESSION_MAX_AGE", "3600")),
+            **session_args,
+        )
+
+        # Every search, extraction and download waits its turn here: separate
+        # rates per kind of call, and a circuit breaker that pauses everything
+        # while YouTube throttles us. FINDER_*_RPS set the rates (0: no limit).
+        from request_scheduler import RequestScheduler
+        self.requests = request_scheduler or RequestScheduler(
+            rates={
+                "search": float(os.getenv("FINDER_SEARCH_RPS", "0.5")),
+                "extract": float(os.getenv("FINDER_EXTRACT_RPS", "1")),
+                "download": float(os.getenv("FINDER_DOWNLOAD_RPS", "0.5")),
+            },
+        )
+
+        # Persistent index of IDs we've already attempted (and played), shared
+        # with the player process. This reduces repeated lookups from
+        # overlapping/random searches, across restarts too.
+        self._seen_ids = SeenIndex(max_age_days=self.max_age_days)
+
+        # Concurrent vetting: per-entry metadata extraction runs on a bounded
+        # worker pool. We keep the first `vet_accept_count` passing candidates
+        # from a search; anything that passes beyond that is kept for the next call.
+        self.vet_workers = max(1, int(os.getenv("YT_VET_WORKERS", "4")))
+        self.vet_accept_count = max(1, int(os.getenv("YT_VET_ACCEPT", "2")))
+        # Created on first use: FinderService vets on its own executor instead.
+        self._vet_pool = None
+        self._vet_pool_lock = threading.Lock()
+        self._accepted_videos = collections.deque()
+
+        # How many search entries the flat-metadata prefilter decided on its own.
+        self.prefilter_stats = collections.Counter()
+
+        # Learns which query words actually turn up usable videos.
+        self.query_planner = QueryPlanner()
+
+        # Prefiltered entries from earlier searches, used before searching again.
+        # A candidate whose extraction failed for throttling or network reasons
+        # goes back in the reservoir up to this many times.
+        self.max_vet_attempts = 3
+        self.reservoir = CandidateReservoir(
+            low_water=int(os.getenv("YT_RESERVOIR_LOW_WATER", "10")),
+            max_age_days=self.max_age_days,
+        )
+        self._refill_thread = None
 
     @staticmethod
     def _normalize_sp(sp_value: str) -> str:
@@ -105,23 +198,8 @@ class Ydl:
         return s
 
     def _random_query(self):
-        seed_words = [
-            "test", "demo", "vlog", "video", "clip", "first", "my", "day", "new", "update",
-            "img", "dsc", "camera", "phone", "setup", "build", "repair", "art", "music", "cover", "song",
-            "life", "travel", "dog", "cat", "challenge", "fun", "music", "workout", "fitness",
-            "food", "recipe", "nature", "art", "movie", "review", "unboxing", "science", "technology",
-            "learn", "how", "guide", "explore", "trick", "tips", "experiment", "animal", "car", "road",
-            "short", "trend", "random", "kids", "play", "let's", "game", "dance", "cute", "best", "hello",
-        ]
-        w1 = random.choice(seed_words)
-        w2 = random.choice(seed_words)
-        if random.random() < 0.6:
-            token = str(random.randint(0, 9999)).zfill(4)
-        else:
-            token = "".join(random.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(random.randint(3, 5)))
-        if w1 == w2:
-            w2 = random.choice([w for w in seed_words if w != w1])
-        return f"{w1} {w2} {token}"
+        # Biased toward seed words/token styles that have produced accepted videos.
+        return self.query_planner.next_query()
 
     def _is_recent_enough(self, upload_date):
         try:
@@ -140,140 +218,402 @@ class Ydl:
             return f"https://www.youtube.com/watch?v={vid}"
         return None
 
-    def _prelim_video_valid(self, entry):
-        vid = entry.get("id")
-        if not vid:
-            return False
+    def _normalize_candidate(self, entry):
+        """
+        Build a normalized candidate record from a flat search-results entry.
 
+        Fields that the results page didn't provide are left as None. The
+        upload timestamp is only there because YDL_OPTIONS asks yt-dlp for
+        `approximate_date`.
+        """
         url = self._candidate_url(entry) or ""
-        if "/shorts/" in url:
-            print(f"Skipping {url}: not a shorts video")
-            return False
 
+        age_days = None
+        upload_date = entry.get("upload_date")
+        if upload_date:
+            try:
+                age_days = (datetime.datetime.now() - datetime.datetime.strptime(upload_date, "%Y%m%d")).days
+            except Exception:
+                age_days = None
+        if age_days is None:
+            timestamp = entry.get("timestamp")
+            if isinstance(timestamp, (int, float)):
+                age_days = int((time.time() - timestamp) // 86400)
+
+        # yt-dlp already reports "No views" as view_count 0.
+        view_count = entry.get("view_count")
         duration = entry.get("duration")
-        if isinstance(duration, (int, float)) and duration < self.min_duration_seconds:
-            print("Skipping short video")
-            return False
 
+        return {
+            "id": entry.get("id"),
+            "url": url,
+            "is_short": "/shorts/" in url,
+            "live_status": entry.get("live_status"),
+            "availability": entry.get("availability"),
+            "duration": float(duration) if isinstance(duration, (int, float)) else None,
+            "age_days": age_days,
+            "view_count": int(view_count) if isinstance(view_count, (int, float)) else None,
+        }
+
+    def _prefilter_candidate(self, record):
+        """
+        Decide a candidate from its flat metadata alone.
+
+        Returns ("reject", reason), ("pass", None) when every checkable field is
+        known and fine, or ("ambiguous", None) when something still needs a
+        per-video extraction.
+        """
+        if not record["id"]:
+            return "reject", "no id"
+        if record["is_short"]:
+            return "reject", "shorts"
+        if record["live_status"] in ("is_live", "is_upcoming"):
+            return "reject", "live"
+        if record["availability"] in ("private", "premium_only", "subscriber_only", "needs_auth"):
+            return "reject", "unavailable"
+
+        duration = record["duration"]
+        if duration is not None and duration < self.min_duration_seconds:
+            return "reject", "too short"
+        age_days = record["age_days"]
+        if age_days is not None and age_days > self.max_age_days:
+            return "reject", "too old"
+        view_count = record["view_count"]
+        if view_count is not None and view_count > self.max_views:
+            return "reject", "too many views"
+
+        if duration is None or age_days is None or view_count is None:
+            return "ambiguous", None
+        return "pass", None
+
+    def _prefilter_entry(self, entry):
+        record = self._normalize_candidate(entry)
+        verdict, reason = self._prefilter_candidate(record)
+        self.prefilter_stats["entries"] += 1
+        self.prefilter_stats[verdict] += 1
+        if verdict == "reject":
+            # Only the old duration/upload_date/view_count checks could reject
+            # without an extraction; anything else we reject is a saved extraction.
+            if not self._legacy_prelim_rejects(entry):
+                self.prefilter_stats["extractions_saved"] += 1
+            metrics.inc("finder_prefilter_rejections_total", reason=reason)
+            metrics.debug(f"Skipping {record['url']}: {reason}")
+        else:
+            metrics.inc("finder_prefilter_verdicts_total", verdict=verdict)
+        return verdict
+
+    def _legacy_prelim_rejects(self, entry):
+        url = self._candidate_url(entry) or ""
+        if not entry.get("id") or "/shorts/" in url:
+            return True
+        duration = entry.get("duration")
+        if isinstance(duration, (int, float)) and duration < self.min_duration_seconds:
+            return True
         upload_date = entry.get("upload_date")
         if upload_date and not self._is_recent_enough(upload_date):
-            print("Skipping old video")
-            return False
-
+            return True
         view_count = entry.get("view_count")
-        if isinstance(view_count, (int, float)) and view_count > self.max_views:
-            print("Skipping video with too many views")
-            return False
-
-        return True
+        return isinstance(view_count, (int, float)) and view_count > self.max_views
 
-    def _secondary_video_valid(self, info):
+    def _secondary_reject_reason(self, info):
         if "/shorts/" in (info.get("webpage_url") or ""):
-            print("Skipping shorts video")
-            return False
+            return "shorts"
 
         duration = info.get("duration")
         if isinstance(duration, (int, float)) and duration < self.min_duration_seconds:
-            print("Skipping short video")
-            return False
+            return "too short"
 
         upload_date = info.get("upload_date")
         if upload_date and not self._is_recent_enough(upload_date):
-            print("Skipping old video")
-            return False
+            return "too old"
 
         view_count = info.get("view_count")
         if isinstance(view_count, (int, float)) and view_count > self.max_views:
-            print("Skipping video with too many views")
-            return False
+            return "too many views"
 
         try:
             # Prefer lightweight fields first; `formats` is often missing when we
             # do a metadata-only extraction (process=False).
             ar = info.get("aspect_ratio")
             if isinstance(ar, (int, float)) and ar < self.min_aspect_ratio:
-                print("Skipping video with too small aspect ratio")
-                return False
+                return "aspect ratio"
 
             w = info.get("width")
             h = info.get("height")
             if isinstance(w, (int, float)) and isinstance(h, (int, float)) and h != 0:
                 if (w / h) < self.min_aspect_ratio:
-                    print("Skipping video with too small aspect ratio")
-                    return False
+                    return "aspect ratio"
         except Exception:
             pass
 
-        return True
+        return None
+
+    def _secondary_video_valid(self, info):
+        reason = self._secondary_reject_reason(info)
+        if reason is None:
+            return True
+        metrics.inc("finder_secondary_rejections_total", reason=reason)
+        metrics.debug(f"Skipping video {info.get('id', 'unknown')}: {reason}")
+        return False
 
     def _remember_seen_id(self, vid):
-        if not vid:
-            return
         self._seen_ids.add(vid)
-        if len(self._seen_ids) > self._seen_ids_max:
-            self._seen_ids.clear()
+
+    def vet_entry(self, entry):
+        """
+        Run the per-video metadata extraction and secondary checks for one search entry.
+
+        Returns the extracted info if the video is acceptable, else None. Runs on a
+        vetting worker thread.
+        """
+        vid = entry.get("id")
+        url = self._candidate_url(entry)
+        if not url:
+            return None
+
+        try:
+            metrics.debug(f"Extracting video info for: {url}")
+            with self.requests.call("extract"), metrics.span("finder_extract"), self.sessions.session() as ydl:
+                info = ydl.extract_info(url, download=False, process=False)
+        except Exception as e:
+            # Like the session pool, loaded lazily so decoding-only processes never import yt-dlp.
+            from request_scheduler import PERMANENT, classify_error
+            kind = classify_error(e)
+            print(f"Failed to extract video info ({kind}): {type(e).__name__}: {e}")
+            # Only give up on the video if the failure was about the video itself.
+            attempts = entry.get("_vet_attempts", 0) + 1
+            if kind != PERMANENT and attempts < self.max_vet_attempts:
+                entry["_vet_attempts"] = attempts
+                self._return_to_reservoir([entry], confident=False)
+            else:
+                self._remember_seen_id(vid)
+            return None
+
+        self._remember_seen_id(vid or info.get("id"))
+        if not self._secondary_video_valid(info):
+            return None
+        self.query_planner.record_accept(entry.get("_search_query"))
+        return info
+
+    def _keep_late_accept(self, future):
+        # A vetting job that was already running when we hit our quota still
+        # produced a usable video; hold onto it for the next call.
+        if future.cancelled() or future.exception() is not None:
+            return
+        info = future.result()
+        if info is not None:
+            print(f"Keeping late-accepted video for later: {info.get('id', 'unknown')}")
+            self._accepted_videos.append(info)
+
+    def prefilter_entries(self, entries):
+        """
+        Split search entries into (confident, ambiguous) candidates, dropping rejects and seen IDs.
+
+        Confident entries pass every check their flat metadata allows and can skip
+        the per-video extraction; ambiguous ones still need `vet_entry`.
+        """
+        confident = []
+        ambiguous = []
+        queries = set()
+        for entry in entries:
+            if not isinstance(entry, dict):
+                continue
+            queries.add(entry.get("_search_query"))
+            verdict = self._prefilter_entry(entry)
+            if verdict == "reject":
+                continue
+
+            vid = entry.get("id")
+            if vid and vid in self._seen_ids:
+                metrics.inc("finder_prefilter_rejections_total", reason="seen")
+                metrics.debug(f"Video {vid} already seen, skipping")
+                continue
+
+            if not self._candidate_url(entry):
+                continue
+            if verdict == "pass":
+                confident.append(entry)
+            else:
+                ambiguous.append(entry)
+
+        for query in queries:
+            if query:
+                self.query_planner.record_search(
+                    query,
+                    sum(1 for e in entries if isinstance(e, dict) and e.get("_search_query") == query),
+                    sum(1 for e in confident + ambiguous if e.get("_search_query") == query),
+                )
+
+        metrics.debug(
+            "Prefilter stats: "
+            + ", ".join(f"{key}={self.prefilter_stats[key]}" for key in ("entries", "reject", "pass", "ambiguous", "extractions_saved"))
+        )
+        metrics.set_gauge("finder_prefilter_extractions_saved", self.prefilter_stats["extractions_saved"])
+        return confident, ambiguous
+
+    def accept_from_search(self, entry):
+        """
+        Accept a confident entry without a per-video extraction.
+
+        `download_video` re-checks the full info (aspect ratio etc.) before
+        downloading anything.
+        """
+        info = dict(entry)
+        info["webpage_url"] = self._candidate_url(entry)
+        self._remember_seen_id(info.get("id"))
+        self.prefilter_stats["extractions_saved"] += 1
+        self.query_planner.record_accept(entry.get("_search_query"))
+        print(f"Accepted video from search metadata: {info.get('id', 'unknown')}")
+        return info
+
+    def _vet_candidates(self, confident, ambiguous):
+        """
+        Vet candidates concurrently and return up to `vet_accept_count` accepted infos.
+
+        Candidates we didn't get to go back into the reservoir.
+        """
+        accepted = []
+        for entry in confident[:self.vet_accept_count]:
+            accepted.append(self.accept_from_search(entry))
+        self._return_to_reservoir(confident[self.vet_accept_count:], confident=True)
+
+        if len(accepted) >= self.vet_accept_count:
+            self._return_to_reservoir(ambiguous, confident=False)
+            return accepted
+        if not ambiguous:
+            return accepted
+
+        with self._vet_pool_lock:
+            if self._vet_pool is None:
+                self._vet_pool = ThreadPoolExecutor(max_workers=self.vet_workers, thread_name_prefix="vet")
+        futures = {self._vet_pool.submit(self.vet_entry, entry): entry for entry in ambiguous}
+        try:
+            for future in as_completed(futures):
+                try:
+                    info = future.result()
+                except Exception as e:
+                    print(f"Vetting failed: {type(e).__name__}: {e}")
+                    continue
+                if info is None:
+                    continue
+                accepted.append(info)
+                print(f"Accepted video: {info.get('id', 'unknown')}")
+                if len(accepted) >= self.vet_accept_count:
+                    break
+        finally:
+            # Cancel anything not yet started and pool it again; jobs already in
+            # flight finish in the background and are kept if they pass.
+            for future, entry in futures.items():
+                if future.done():
+                    continue
+                if future.cancel():
+                    self._return_to_reservoir([entry], confident=False)
+                else:
+                    future.add_done_callback(self._keep_late_accept)
+        return accepted
+
+    def _return_to_reservoir(self, entries, confident):
+        for entry in entries:
+            self.reservoir.add(entry, self._normalize_candidate(entry), confident)
+
+    def _take_from_reservoir(self, count):
+        """Pop up to `count` pooled candidates, split into (confident, ambiguous)."""
+        confident = []
+        ambiguous = []
+        for _ in range(count):
+            item = self.reservoir.pop(skip=lambda entry: entry.get("id") in self._seen_ids)
+            if item is None:
+                break
+            entry, is_confident = item
+            (confident if is_confident else ambiguous).append(entry)
+        return confident, ambiguous
+
+    def search_into_reservoir(self, query):
+        """Run one search and pool everything that survives the prefilter. Returns the number pooled."""
+        entries = self.search_entries(query)
+        confident, ambiguous = self.prefilter_entries(entries)
+        self._return_to_reservoir(confident, confident=True)
+        self._return_to_reservoir(ambiguous, confident=False)
+        metrics.set_gauge("finder_reservoir_size", len(self.reservoir))
+        metrics.debug(f"Reservoir holds {len(self.reservoir)} candidates")
+        return len(confident) + len(ambiguous)
+
+    def _refill_loop(self):
+        backoff = 0.25
+        while True:
+            self.reservoir.wait_until_low()
+            query = self._random_query()
+            print(f"Refilling candidate reservoir with query: {query}")
+            try:
+                self.search_into_reservoir(query)
+                backoff = 0.25
+            except Exception as e:
+                print(f"Background search failed: {type(e).__name__}: {e}, sleeping {backoff}s")
+                time.sleep(backoff)
+                backoff = min(2.0, backoff * 1.1)
+
+    def start_background_refill(self):
+        """Keep the reservoir above its low-water mark from a background thread."""
+        if self._refill_thread is None:
+            self._refill_thread = threading.Thread(target=self._refill_loop, name="reservoir-refill", daemon=True)
+            self._refill_thread.start()
+
+    def _search_url(self, query):
+        if self.youtube_search_sp:
+            # Use YouTube's own filtered results page.
+            # NOTE: `search_results_per_query` is not enforced here; YouTube will decide how many
+            # results to return. We still randomize and filter locally.
+            search_query = urllib.parse.quote_plus(query)
+            return f"https://www.youtube.com/results?search_query={search_query}&sp={self.youtube_search_sp}"
+        return f"ytsearchdate{self.search_results_per_query}:{query}"
+
+    def search_entries(self, query):
+        """Run one search and return its flat entries in random order. Safe to call from any thread."""
+        search = self._search_url(query)
+        metrics.debug(f"Extracting search results from: {search}")
+        with self.requests.call("search"), metrics.span("finder_search"), self.sessions.session() as ydl:
+            res = ydl.extract_info(search, download=False, process=False)
+        entries = list(res.get("entries") or [])
+        metrics.observe("finder_search_results", len(entries), buckets=(0, 1, 5, 10, 20, 30, 50, 100))
+        print(f"Found {len(entries)} search results for: {query}")
+        # Tag entries so outcomes can be credited back to the query that found them.
+        for entry in entries:
+            if isinstance(entry, dict):
+                entry["_search_query"] = query
+        random.shuffle(entries)
+        if not entries:
+            self.query_planner.record_search(query, 0, 0)
+        return entries
 
     def get_unwatched_video(self):
+        if self._accepted_videos:
+            video = self._accepted_videos.popleft()
+            print(f"Using previously accepted video: {video.get('id', 'unknown')}")
+            return video
+
         video = None
         backoff = 0.25
         search_attempts = 0
 
         while video is None:
+            # Pooled candidates from earlier searches come first.
+            confident, ambiguous = self._take_from_reservoir(self.vet_workers * 2)
+            if confident or ambiguous:
+                accepted = self._vet_candidates(confident, ambiguous)
+                if accepted:
+                    video = accepted[0]
+                    self._accepted_videos.extend(accepted[1:])
+                    print(f"Selected video: {video.get('id', 'unknown')}")
+                continue
+
             search_attempts += 1
             query = self._random_query()
             print(f"Search attempt #{search_attempts} with query: {query}")
 
-            if self.youtube_search_sp:
-                # Use YouTube's own filtered results page.
-                # NOTE: `search_results_per_query` is not enforced here; YouTube will decide how many
-                # results to return. We still randomize and filter locally.
-                search_query = urllib.parse.quote_plus(query)
-                search = f"https://www.youtube.com/results?search_query={search_query}&sp={self.youtube_search_sp}"
-            else:
-                search = f"ytsearchdate{self.search_results_per_query}:{query}"
-
             try:
-                print(f"Extracting search results from: {search}")
-                res = self.ydl.extract_info(search, download=False, process=False)
-                entries = list(res.get("entries") or [])
-                print(f"Found {len(entries)} search results")
-                if not entries:
-                    print("No entries found, sleeping and retrying...")
+                if not self.search_into_reservoir(query):
+                    print("No usable entries found, sleeping and retrying...")
                     time.sleep(backoff)
-                    continue
-
-                random.shuffle(entries)
-                for entry in entries:
-                    if not isinstance(entry, dict):
-                        continue
-                    if not self._prelim_video_valid(entry):
-                        continue
-
-                    vid = entry.get("id")
-                    if vid and vid in self._seen_ids:
-                        print(f"Video {vid} already seen, skipping")
-                        continue
-
-                    url = self._candidate_url(entry)
-                    if not url:
-                        continue
-
-                    try:
-                        print(f"Extracting video info for: {url}")
-                        info = self.ydl.extract_info(url, download=False, process=False)
-                    except Exception as e:
-                        print(f"Failed to extract video info: {type(e).__name__}: {e}")
-                        self._remember_seen_id(vid)
-                        continue
-
-                    if not self._secondary_video_valid(info):
-                        self._remember_seen_id(vid or info.get("id"))
-                        continue
-
-                    video = info
-                    self._remember_seen_id(vid or info.get("id"))
-                    print(f"Selected video: {video.get('id', 'unknown')}")
-                    break
             except Exception as e:
                 print(f"Search failed: {type(e).__name__}: {e}, sleeping {backoff}s")
                 time.sleep(backoff)
@@ -283,7 +623,13 @@ class Ydl:
         print(f"Successfully found video after {search_attempts} search attempts")
         return video
 
-    def download_video(self, video):
+    def download_video(self, video, on_start=None):
+        """
+        Download a vetted video into TEMP_DIR and return its path, or None.
+
+        `on_start(filename)` is called with the final output path just before the
+        download begins; while it runs, the data is written to `filename + ".part"`.
+        """
         try:
             # Ensure output directory exists (absolute, stable across processes/services)
             os.makedirs(TEMP_DIR, exist_ok=True)
@@ -298,11 +644,24 @@ class Ydl:
 
             print(f"Downloading video {url}")
 
-            # Use extract_info(download=True) so we can deterministically derive the output filename.
-            info = self.ydl.extract_info(url, download=True)
+            # Extract first so the full metadata (aspect ratio etc.) can be checked for
+            # candidates accepted straight from search results, then download from
+            # that same info so we can deterministically derive the output filename.
+            # Downloads may run on several threads; each uses its own YoutubeDL.
+            with self.requests.call("extract"), metrics.span("finder_extract", kind="full"), self.sessions.session() as ydl:
+                info = ydl.extract_info(url, download=False)
+            if not self._secondary_video_valid(info):
+                return None
+            if on_start is not None:
+                try:
+                    on_start(ydl.prepare_filename(info))
+                except Exception as e:
+                    print(f"Download start callback failed: {type(e).__name__}: {e}")
+            with self.requests.call("download"), metrics.span("finder_download"), self.sessions.session() as ydl:
+                info = ydl.process_ie_result(info, download=True)
             filename = None
             try:
-                filename = self.ydl.prepare_filename(info)
+                filename = ydl.prepare_filename(info)
             except Exception:
                 # Fallback to expected mp4 name if prepare_filename fails for some reason.
                 vid = (info or {}).get("id") or video.get("id")
@@ -310,6 +669,8 @@ class Ydl:
                     filename = os.path.join(TEMP_DIR, f"{vid}.mp4")
 
             if filename and os.path.exists(filename):
+                metrics.inc("finder_download_bytes_total", os.path.getsize(filename))
+                metrics.inc("finder_downloads_total")
                 return filename
 
             # Helpful extra signal: check if a partial file was left behind.
@@ -338,18 +699,29 @@ def center_crop(image, aspect_ratio):
     else:
         return image
 
-def iter_video_frames(video_file, resolution=(96, 48), target_fps=None, max_seconds=30):
-    """
-    Stream frames from a local video file at the correct frame rate.
+# Decode backends: "ffmpeg" pipes already cropped/scaled rgb24 frames out of an
+# ffmpeg subprocess, so full-resolution frames never reach Python; "opencv"
+# decodes with cv2.VideoCapture and downsamples here. "auto" prefers ffmpeg
+# when the binary is available.
+DECODE_BACKEND = os.getenv("DECODE_BACKEND", "auto").strip().lower()
 
-    If `target_fps` is None, we pace to the video's own timestamps/FPS (preferred).
-    If `target_fps` is provided, we pace to that value (useful for downsampling).
-    This avoids pre-decoding the whole video and avoids cross-process transfer of huge frame arrays.
+def _iter_decoded_frames(video_file, resolution=(96, 48), max_seconds=30, stats=None, backend=None, should_drop=None, lut=PANEL_LUT):
     """
-    import logging
-    logger = logging.getLogger(__name__)
+    Decode a local video file into (pos_ms, frame) pairs at `resolution`, unpaced.
 
-    print(f"Starting frame streaming for: {video_file}")
+    `pos_ms` is the container timestamp of the frame (None if unavailable).
+    Decoding stops once container time reaches `max_seconds`. If given,
+    `should_drop(pos_ms)` is asked about every frame before it is converted;
+    frames it rejects are skipped as cheaply as the backend allows. `lut` is
+    the panel gamma table (None to skip it).
+
+    Frames are views into reused buffers and are only valid until a couple more
+    have been yielded; copy any frame you keep.
+    """
+    # A download still in progress can only be followed through an ffmpeg pipe.
+    if is_streaming(video_file):
+        yield from _iter_ffmpeg_frames(video_file, resolution=resolution, max_seconds=max_seconds, stats=stats, should_drop=should_drop, lut=lut, follow=True)
+        return
 
     # Check if file exists and is readable
     if not os.path.exists(video_file):
@@ -366,6 +738,27 @@ def iter_video_frames(video_file, resolution=(96, 48), target_fps=None, max_seco
         print(f"ERROR: Error checking video file: {e}")
         return
 
+    backend = (backend or DECODE_BACKEND)
+    if backend == "auto":
+        backend = "ffmpeg" if shutil.which("ffmpeg") else "opencv"
+
+    if backend == "ffmpeg":
+        produced = False
+        try:
+            for item in _iter_ffmpeg_frames(video_file, resolution=resolution, max_seconds=max_seconds, stats=stats, should_drop=should_drop, lut=lut):
+                produced = True
+                yield item
+        except Exception as e:
+            if produced:
+                raise
+            print(f"ffmpeg decode failed ({type(e).__name__}: {e}), falling back to OpenCV")
+        if produced:
+            return
+        print("ffmpeg produced no frames, falling back to OpenCV")
+
+    yield from _iter_opencv_frames(video_file, resolution=resolution, max_seconds=max_seconds, stats=stats, should_drop=should_drop, lut=lut)
+
+def _iter_opencv_frames(video_file, resolution=(96, 48), max_seconds=30, stats=None, should_drop=None, lut=PANEL_LUT):
     cap = cv2.VideoCapture(video_file)
     if not cap.isOpened():
         print(f"ERROR: Failed to open video: {video_file}")
@@ -373,77 +766,310 @@ def iter_video_frames(video_file, resolution=(96, 48), target_fps=None, max_seco
         return
 
     print("Video capture opened successfully")
+    preprocessor = FramePreprocessor(resolution, lut=lut)
+    source = None
 
-    def _get_capture_fps():
-        try:
-            fps = float(cap.get(cv2.CAP_PROP_FPS))
-        except Exception:
-            fps = 0.0
-        # OpenCV may return 0/NaN/inf for some containers.
-        if not (fps > 1e-6) or fps != fps or fps == float("inf"):
-            return None
-        return fps
+    try:
+        while True:
+            # Hard stop so we never decode more than max_seconds of content.
+            pos_ms = None
+            try:
+                pos_ms = cap.get(cv2.CAP_PROP_POS_MSEC)
+                if isinstance(pos_ms, (int, float)) and pos_ms > 0 and (pos_ms / 1000.0) >= max_seconds:
+                    break
+            except Exception:
+                pass
 
-    capture_fps = _get_capture_fps()
-    paced_fps = float(target_fps) if target_fps is not None else (capture_fps or 30.0)
+            t0 = time.thread_time() if stats is not None else 0.0
+            # grab() demuxes and decodes but skips the pixel-format conversion
+            # that retrieve() does, so dropped frames cost as little as possible.
+            if not cap.grab():
+                break
 
-    start_wall = time.perf_counter()
-    base_pos_ms = None
-    frame_index = 0
+            # Position after the grab is the timestamp of the frame we just got.
+            try:
+                pos_ms = cap.get(cv2.CAP_PROP_POS_MSEC)
+            except Exception:
+                pos_ms = None
+            if not (isinstance(pos_ms, (int, float)) and pos_ms > 0):
+                pos_ms = None
+
+            if should_drop is not None and should_drop(pos_ms):
+                if stats is not None:
+                    stats.add("decode", time.thread_time() - t0)
+                continue
+
+            # Decode into the same source buffer every time.
+            ret, source = cap.retrieve(source)
+            if not ret or source is None:
+                break
 
-    while True:
-        # Hard stop so we never play for more than max_seconds.
-        # Prefer container timestamps when available; fall back to our pacing clock.
+            try:
+                frame = preprocessor.process(source, stats=stats, t0=t0)
+            except Exception:
+                continue
+
+            yield pos_ms, frame
+    finally:
+        cap.release()
+
+
+# showinfo prints "pts_time:NOPTS" for frames without a timestamp; those are queued as None.
+_SHOWINFO_PTS = re.compile(r"pts_time:\s*(-?[0-9.]+|NOPTS)")
+
+def _follow_growing_file(part_file, out, stall_seconds=None, chunk_size=64 * 1024):
+    """
+    Copy a file that is still being downloaded into `out` as it grows.
+
+    yt-dlp renames `<name>.part` to `<name>` when the download finishes (or
+    deletes it if it fails); once the .part name is gone we copy whatever is
+    left and stop. We also stop if the file hasn't grown for `stall_seconds`.
+    """
+    stall_seconds = STREAM_STALL_SECONDS if stall_seconds is None else stall_seconds
+    try:
+        f = open(part_file, "rb")
+    except FileNotFoundError:
+        # Finished between being queued and being opened.
+        f = open(part_file[:-len(STREAM_SUFFIX)], "rb")
+    with f:
+        last_growth = time.monotonic()
+        while True:
+            data = f.read(chunk_size)
+            if data:
+                out.write(data)
+                last_growth = time.monotonic()
+                continue
+            if not os.path.exists(part_file):
+                # Renamed away: anything written before the rename is still readable through our handle.
+                while True:
+                    data = f.read(chunk_size)
+                    if not data:
+                        return
+                    out.write(data)
+            if time.monotonic() - last_growth > stall_seconds:
+                print(f"Stream stalled for {stall_seconds:.0f}s, ending playback: {part_file}")
+                return
+            time.sleep(0.05)
+
+def _iter_ffmpeg_frames(video_file, resolution=(96, 48), max_seconds=30, stats=None, should_drop=None, lut=PANEL_LUT, follow=False):
+    """
+    Decode through an ffmpeg pipe that crops and scales before frames leave the decoder.
+
+    Per-frame timestamps come from the `showinfo` filter on stderr. Since the work
+    happens in the ffmpeg process, the "decode" stage in `stats` is the wall time
+    spent waiting for each frame rather than our own CPU time. With `follow`,
+    `video_file` is a download in progress that is fed to ffmpeg's stdin as it
+    grows (the container must be readable front to back, e.g. fragmented MP4).
+    """
+    width, height = resolution
+    vf = ffmpeg_crop_scale(resolution) + ",showinfo"
+    cmd = [
+        "ffmpeg", "-hide_banner", "-nostdin", "-loglevel", "info",
+        # Cheaper decode: we throw away almost all detail when downsampling anyway.
+        "-skip_loop_filter", "all", "-flags2", "+fast",
+        "-t", str(max_seconds),
+        "-i", "pipe:0" if follow else video_file,
+        "-an", "-vf", vf,
+        "-vsync", "passthrough",
+        "-pix_fmt", "rgb24", "-f", "rawvideo", "pipe:1",
+    ]
+    proc = subprocess.Popen(
+        cmd, stdin=subprocess.PIPE if follow else None, stdout=subprocess.PIPE, stderr=subprocess.PIPE, bufsize=0,
+    )
+    pts_queue = queue.Queue()
+
+    def _feed_stdin():
         try:
-            pos_ms = cap.get(cv2.CAP_PROP_POS_MSEC)
-            if isinstance(pos_ms, (int, float)) and pos_ms > 0 and (pos_ms / 1000.0) >= max_seconds:
-                break
-        except Exception:
+            _follow_growing_file(video_file, proc.stdin)
+        except (BrokenPipeError, ValueError):
+            # ffmpeg exited (e.g. reached max_seconds) or we closed the pipe.
             pass
+        except Exception as e:
+            print(f"Stream feed failed: {type(e).__name__}: {e}")
+        finally:
+            try:
+                proc.stdin.close()
+            except Exception:
+                pass
 
-        if (time.perf_counter() - start_wall) >= max_seconds:
-            break
+    if follow:
+        threading.Thread(target=_feed_stdin, name="ffmpeg-feed", daemon=True).start()
 
-        ret, frame = cap.read()
-        if not ret or frame is None:
-            break
+    def _read_stderr():
+        for line in proc.stderr:
+            match = _SHOWINFO_PTS.search(line.decode("utf-8", "replace"))
+            if match:
+                # Exactly one entry per frame, so later frames keep their own timestamps.
+                pts_queue.put(None if match.group(1) == "NOPTS" else float(match.group(1)) * 1000.0)
 
-        try:
-            frame = center_crop(frame, resolution[0] / resolution[1])
-            frame = cv2.resize(frame, resolution, interpolation=cv2.INTER_AREA)
-            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        except Exception:
-            continue
+    threading.Thread(target=_read_stderr, name="ffmpeg-stderr", daemon=True).start()
 
-        # Pace playback.
-        #
-        # Prefer the video's own timestamps (better for variable-FPS content).
-        # If timestamps aren't available, pace using FPS.
-        now = time.perf_counter()
-        target_wall = None
-        try:
-            pos_ms = cap.get(cv2.CAP_PROP_POS_MSEC)
-            if isinstance(pos_ms, (int, float)) and pos_ms > 0:
-                if base_pos_ms is None:
-                    base_pos_ms = pos_ms
-                    # Anchor "video time 0" to the current wall clock.
-                    start_wall = now
-                target_wall = start_wall + ((pos_ms - base_pos_ms) / 1000.0)
-        except Exception:
-            target_wall = None
+    frame_bytes = width * height * 3
+    # Frames are read straight into a small ring of preallocated buffers.
+    ring = [np.empty((height, width, 3), dtype=np.uint8) for _ in range(3)]
+    ring_index = 0
+    try:
+        while True:
+            t0 = time.perf_counter() if stats is not None else 0.0
+            frame = ring[ring_index]
+            ring_index = (ring_index + 1) % len(ring)
+            view = memoryview(frame.reshape(-1))
+            got = 0
+            while got < frame_bytes:
+                n = proc.stdout.readinto(view[got:])
+                if not n:
+                    break
+                got += n
+            if got < frame_bytes:
+                break
+            if stats is not None:
+                stats.add("decode", time.perf_counter() - t0)
+
+            # showinfo logs each frame as it passes through the filter graph,
+            # which happens before the frame is written to our pipe.
+            try:
+                pos_ms = pts_queue.get(timeout=0.5)
+            except queue.Empty:
+                pos_ms = None
+            if pos_ms is not None and pos_ms <= 0:
+                pos_ms = None
+
+            # ffmpeg has already decoded and scaled this frame; dropping it just
+            # keeps us from waiting on it.
+            if should_drop is not None and should_drop(pos_ms):
+                continue
+
+            if lut is not None:
+                t1 = time.thread_time() if stats is not None else 0.0
+                cv2.LUT(frame, lut, dst=frame)
+                if stats is not None:
+                    stats.add("convert", time.thread_time() - t1)
+
+            yield pos_ms, frame
+    finally:
+        if proc.poll() is None:
+            proc.kill()
+        proc.wait()
+        proc.stdout.close()
+
+def _get_capture_fps(video_file):
+    cap = cv2.VideoCapture(video_file)
+    try:
+        fps = float(cap.get(cv2.CAP_PROP_FPS))
+    except Exception:
+        fps = 0.0
+    finally:
+        cap.release()
+    # OpenCV may return 0/NaN/inf for some containers.
+    if not (fps > 1e-6) or fps != fps or fps == float("inf"):
+        return None
+    return fps
+
+def iter_video_frames(video_file, resolution=(96, 48), target_fps=None, max_seconds=30, stats=None, decode_backend=None):
+    """
+    Stream frames from a local video file at the correct frame rate.
+
+    If `target_fps` is None, we pace to the video's own timestamps/FPS (preferred).
+    If `target_fps` is provided, we pace to that value (useful for downsampling).
+    This avoids pre-decoding the whole video and avoids cross-process transfer of huge frame arrays.
+    Frames that fall too far behind are dropped (see FRAME_DROP_LATENESS) so playback
+    keeps real-time speed on slow hardware.
+    Pass a `FrameStats` as `stats` to collect per-stage timings. `decode_backend`
+    overrides DECODE_BACKEND ("auto", "ffmpeg" or "opencv").
+    """
+    print(f"Starting frame streaming for: {video_file}")
+
+    capture_fps = _get_capture_fps(video_file) if os.path.exists(video_file) and not is_streaming(video_file) else None
+    paced_fps = float(target_fps) if target_fps is not None else (capture_fps or 30.0)
+
+    clock = _PlaybackClock(paced_fps, stats=stats)
+    frame_index = 0
 
-        if target_wall is None:
-            target_wall = start_wall + (frame_index / paced_fps)
+    decoded = _iter_decoded_frames(
+        video_file, resolution=resolution, max_seconds=max_seconds, stats=stats,
+        backend=decode_backend, should_drop=clock.should_drop,
+    )
+    for pos_ms, frame in decoded:
+        if (time.perf_counter() - clock.start_wall) >= max_seconds:
+            break
 
-        sleep_for = target_wall - now
-        if sleep_for > 0:
-            time.sleep(sleep_for)
+        clock.wait()
 
         frame_index += 1
         yield frame
 
-    print(f"Finished streaming {frame_index} frames from {video_file}")
-    cap.release()
+    dropped = stats.dropped_frames if stats is not None else 0
+    print(f"Finished streaming {frame_index} frames from {video_file} ({dropped} dropped)")
+
+def prerender_video(video_file, resolution=(96, 48), max_seconds=30, decode_backend=None):
+    """
+    Transcode a downloaded video into a pre-rendered clip next to it.
+
+    Returns the path of the pre-rendered clip, or None if nothing could be decoded.
+    The source video is left in place; callers decide when to delete it.
+    """
+    base, _ = os.path.splitext(video_file)
+    out_path = base + PRERENDERED_SUFFIX
+    tmp_path = base + ".frames.tmp.npy"
+
+    fps = (_get_capture_fps(video_file) if os.path.exists(video_file) else None) or 30.0
+    width, height = resolution
+    # Decoded frames live in reused buffers, so copy each into one preallocated
+    # array (grown if the clip turns out longer than expected).
+    frames = np.empty((int(fps * max_seconds) + 2, height, width, 3), dtype=np.uint8)
+    pts = []
+    started = time.perf_counter()
+    # Gamma is applied to the whole clip at once below rather than per frame.
+    for pos_ms, frame in _iter_decoded_frames(video_file, resolution=resolution, max_seconds=max_seconds, backend=decode_backend, lut=None):
+        count = len(pts)
+        if pos_ms is None:
+            # One frame after the previous one, so timestamps keep increasing.
+            pos_ms = pts[-1] + 1000.0 / fps if pts else 0.0
+        if count == len(frames):
+            frames = np.concatenate([frames, np.empty_like(frames)])
+        frames[count] = frame
+        pts.append(pos_ms)
+
+    if not pts:
+        print(f"Pre-render produced no frames: {video_file}")
+        return None
+
+    try:
+        frames = apply_lut(frames[:len(pts)])
+        clip = np.empty(len(pts), dtype=prerendered_dtype(resolution))
+        clip["pts_ms"] = pts
+        clip["rgb"] = frames
+        np.save(tmp_path, clip)
+        # Atomic rename so the player never sees a half-written clip.
+        os.replace(tmp_path, out_path)
+    except Exception as e:
+        print(f"Failed to write pre-rendered clip {out_path}: {type(e).__name__}: {e}")
+        delete_video(tmp_path)
+        return None
+
+    print(f"Pre-rendered {len(pts)} frames in {time.perf_counter() - started:.1f}s: {out_path} ({os.path.getsize(out_path)} bytes)")
+    return out_path
+
+def decode_into_ring(ring, clip_id, video_file, resolution=(96, 48), max_seconds=30, decode_backend=None):
+    """
+    Decoder-process side of `iter_ring_frames`: decode a clip into a FrameRing as fast as it has room.
+
+    Stops early if the player cancels the clip. Frames without a container
+    timestamp get one from the frame rate so the player can always pace by pts.
+    """
+    fps = (_get_capture_fps(video_file) if os.path.exists(video_file) and not is_streaming(video_file) else None) or 30.0
+    count = 0
+    last_pos_ms = None
+    for pos_ms, frame in _iter_decoded_frames(video_file, resolution=resolution, max_seconds=max_seconds, backend=decode_backend):
+        if pos_ms is None:
+            # One frame after the previous one, so timestamps keep increasing.
+            pos_ms = last_pos_ms + 1000.0 / fps if last_pos_ms is not None else 0.0
+        if not ring.put(clip_id, pos_ms, frame):
+            break
+        last_pos_ms = pos_ms
+        count += 1
+    ring.end_clip(clip_id)
+    return count
 
 def get_video_frames(video_file, resolution=(96, 48)):
     print(f"Getting frames: {video_file}")